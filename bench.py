@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmarks the update and serving paths against the simulated TXT, run with
+# python3 bench.py --clients 10 --duration 10
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import tornado.gen
+import tornado.ioloop
+import tornado.websocket
+import main
+import simulator
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def milliseconds(seconds):
+    return '%.3f ms' % (seconds * 1000)
+
+
+class Client(object):
+    def __init__(self):
+        self.messages = 0
+        self.properties = 0
+        self.bytes = 0
+
+    async def run(self, url, until):
+        connection = await tornado.websocket.websocket_connect(url)
+        while time.time() < until:
+            message = await connection.read_message()
+            if message is None:
+                break
+            self.messages += 1
+            self.bytes += len(message)
+            if isinstance(message, bytes):
+                # Timestamp and (index, value) pairs, see
+                # TXTThing.encode_frame.
+                self.properties += (len(message) - 8) // \
+                    struct.calcsize('<Hd')
+                continue
+            data = json.loads(message)
+            if data['messageType'] == 'propertyStatus':
+                self.properties += len(data['data'])
+        connection.close()
+
+
+async def waitForServer(url, timeout=30):
+    until = time.time() + timeout
+    while True:
+        try:
+            connection = await tornado.websocket.websocket_connect(url)
+            connection.close()
+            return
+        except Exception:
+            if time.time() > until:
+                raise
+            await tornado.gen.sleep(0.1)
+
+
+def run(args):
+    txt = simulator.SimulatedTXT()
+    if args.script:
+        with open(args.script) as script:
+            txt.loadScript(json.load(script))
+    else:
+        # Analog inputs are not debounced, so every edge is a notification.
+        # The duties keep both levels longer than a transfer cycle.
+        high = 1 if args.inputs == 'pushbutton' else 5000
+        for num in range(1, 9):
+            txt.setSignal(num, simulator.square(
+                1 / args.rate,
+                high=high,
+                duty=(num + 3) / 14
+            ))
+    if args.inputs == 'voltage' and 'WOT_FILTERS' not in os.environ:
+        # Run the filter, but publish every change.
+        os.environ['WOT_FILTERS'] = json.dumps({
+            'voltage': {'deadband': 0.01}
+        })
+
+    # IMUs on the fake I2C bus, read by the bus scheduler.
+    for index in range(args.i2c):
+        txt.i2c.attach(0x08 + index, simulator.mpu6050())
+    os.environ['WOT_I2C'] = json.dumps([
+        {
+            'type': 'mpu6050',
+            'name': 'imu' + str(index),
+            'address': 0x08 + index,
+            'rate': args.i2c_rate
+        }
+        for index in range(args.i2c)
+    ])
+
+    core = main.wotServer(txt)
+
+    ticks = []
+    update_level = core.update_level
+
+    def timedUpdate():
+        started = time.perf_counter()
+        update_level()
+        ticks.append(time.perf_counter() - started)
+    core.update_level = timedUpdate
+
+    sent = [0]
+    notify_properties = core.thing.notify_properties
+
+    def countedNotify(data):
+        sent[0] += len(data)
+        notify_properties(data)
+    core.thing.notify_properties = countedNotify
+
+    core.start([args.inputs] * 8, ['motor'] * 4)
+    url = 'ws://localhost:8888/'
+    if args.binary:
+        url += '?format=binary'
+    loop = tornado.ioloop.IOLoop.current()
+    clients = [Client() for i in range(args.clients)]
+    try:
+        loop.run_sync(lambda: waitForServer(url))
+
+        del ticks[:]
+        sent[0] = 0
+        reads = txt.i2c.reads
+        started = time.time()
+        until = started + args.duration
+
+        async def runClients():
+            await tornado.gen.multi([
+                client.run(url, until) for client in clients
+            ])
+        loop.run_sync(runClients)
+        elapsed = time.time() - started
+        reads = txt.i2c.reads - reads
+    finally:
+        core.stop()
+        txt.stop()
+
+    messages = sum(client.messages for client in clients)
+    received = sum(client.properties for client in clients)
+    size = sum(client.bytes for client in clients)
+    print('ticks          %d in %.1f s' % (len(ticks), elapsed))
+    print('  mean         ' + milliseconds(sum(ticks) / max(len(ticks), 1)))
+    print('  p50          ' + milliseconds(percentile(ticks, 0.5)))
+    print('  p99          ' + milliseconds(percentile(ticks, 0.99)))
+    print('  max          ' + milliseconds(max(ticks) if ticks else 0))
+    print('notifications  %.1f/s' % (sent[0] / elapsed))
+    print('fan-out        %d clients' % len(clients))
+    print('  messages     %.1f/s' % (messages / elapsed))
+    print('  properties   %.1f/s' % (received / elapsed))
+    print('  bytes        %.1f kB/s' % (size / elapsed / 1024))
+    if args.i2c:
+        print('i2c reads      %.1f/s of %.1f/s' % (
+            reads / elapsed,
+            args.i2c * args.i2c_rate
+        ))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark WebOfTXT against a simulated TXT'
+    )
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=20,
+        help='periods per second of the simulated inputs'
+    )
+    parser.add_argument(
+        '--inputs',
+        choices=['voltage', 'pushbutton'],
+        default='voltage',
+        help='type of the simulated inputs, pushbuttons are debounced'
+    )
+    parser.add_argument(
+        '--i2c',
+        type=int,
+        default=0,
+        help='number of simulated I2C IMUs'
+    )
+    parser.add_argument(
+        '--i2c-rate',
+        type=float,
+        default=100,
+        help='reads per second of each I2C IMU'
+    )
+    parser.add_argument(
+        '--binary',
+        action='store_true',
+        help='subscribe to binary property frames instead of JSON'
+    )
+    parser.add_argument(
+        '--script',
+        help='JSON file of input signals instead of square waves'
+    )
+    return parser.parse_args(argv[1:])
+
+
+if __name__ == '__main__':
+    run(parseArgs(sys.argv))
@@ -2,25 +2,68 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import ftrobopy
+import abc
+import argparse
+import signal
 import webthing
+import jsonschema
 import threading
 import asyncio
 import uuid
 import os
 from pathlib import Path
-import cv2
 import time
+import datetime
+import traceback
+import json
+import math
+import struct
+import array
+import bisect
+import collections
+import contextlib
+import hashlib
+import heapq
+import io
+import email.utils
+import urllib.parse
 import tornado.web
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest
-from tempfile import TemporaryDirectory
-from TouchStyle import *
+import tornado.websocket
+import tornado.ioloop
+import tornado.locks
+import tornado.gen
+import tornado.concurrent
+import tornado.httputil
+import tornado.http1connection
+import tornado.iostream
+import tornado.tcpclient
 
-# TODO persist last configuration?
 # https://github.com/ftrobopy/ftrobopy/blob/master/manual.pdf
 
 
-class SoundAction(webthing.Action):
+class QueuedAction(webthing.Action):
+    # Runs on the ActionExecutor, one action per resource at a time. run,
+    # done and stop are called from the executor thread.
+    def start(self):
+        self.thing.executor.submit(self)
+
+    def resource(self):
+        return self.name
+
+    def run(self):
+        pass
+
+    def done(self):
+        return True
+
+    def stop(self):
+        pass
+
+    def cancel(self):
+        self.thing.executor.cancel(self)
+
+
+class SoundAction(QueuedAction):
     SOUNDS = [
         'Stop',
         'Flugzeug',
@@ -53,6 +96,7 @@ class SoundAction(webthing.Action):
         'Kopf heben',
         'Kopf neigen'
     ]
+    SOUND_IDS = dict(zip(SOUNDS, range(len(SOUNDS))))
 
     def __init__(self, thing, input_):
         webthing.Action.__init__(
@@ -63,24 +107,31 @@ class SoundAction(webthing.Action):
             input_=input_
         )
 
-    def perform_action(self):
+    def resource(self):
+        return 'sound'
+
+    def run(self):
         self.thing.txt.play_sound(
-            self.SOUNDS.index(self.input['sound']),
-            1,
-            self.input['volume']
+            self.SOUND_IDS[self.input['sound']],
+            self.input.get('repeat', 1),
+            self.input.get('volume', 100)
         )
 
-    def cancel(self):
+    def done(self):
+        return self.thing.txt.sound_finished()
+
+    def stop(self):
         self.thing.txt.stop_sound()
 
 
-class ResetCounterAction(webthing.Action):
+class ResetCounterAction(QueuedAction):
     COUNTERS = [
         'C1',
         'C2',
         'C3',
         'C4'
     ]
+    COUNTER_IDS = dict(zip(COUNTERS, range(len(COUNTERS))))
 
     def __init__(self, thing, input_):
         webthing.Action.__init__(
@@ -90,98 +141,2852 @@ class ResetCounterAction(webthing.Action):
             'resetCounter',
             input_=input_
         )
+        self.command = None
+
+    def resource(self):
+        return self.input
+
+    def run(self):
+        index = self.COUNTER_IDS[self.input]
+        self.command = self.thing.txt.getCurrentCounterCmdId(index)
+        self.thing.txt.incrCounterCmdId(index)
+
+    def done(self):
+        # The TXT confirms the reset with a new counter command id.
+        index = self.COUNTER_IDS[self.input]
+        return self.thing.txt.getCurrentCounterCmdId(index) != self.command
+
+
+class StartRecordingAction(webthing.Action):
+    def __init__(self, thing, input_):
+        webthing.Action.__init__(
+            self,
+            uuid.uuid4().hex,
+            thing,
+            'startRecording',
+            input_=input_
+        )
+
+    @staticmethod
+    def check(thing, input_):
+        thing.recorder.check((input_ or {}).get('channels', Recorder.CHANNELS))
+
+    def start(self):
+        self.status = 'pending'
+        self.thing.action_notify(self)
+        try:
+            self.perform_action()
+        except Exception:
+            traceback.print_exc()
+            self.thing.action_failed(self)
+            return
+        self.finish()
 
     def perform_action(self):
-        self.thing.txt.incrCounterCmdId(self.COUNTERS.index(self.input))
+        input_ = self.input or {}
+        self.thing.recorder.start(
+            input_.get('channels', Recorder.CHANNELS),
+            input_.get('duration')
+        )
 
 
-class PressedEvent(webthing.Event):
-    def __init__(self, thing, button):
-        webthing.Event.__init__(self, thing, 'pressedEvent' + button)
+class StopRecordingAction(webthing.Action):
+    def __init__(self, thing, input_):
+        webthing.Action.__init__(
+            self,
+            uuid.uuid4().hex,
+            thing,
+            'stopRecording',
+            input_=input_
+        )
 
+    def perform_action(self):
+        self.thing.recorder.stop()
 
-class ReverseProxyHandler(tornado.web.RequestHandler):
-    client = AsyncHTTPClient()
 
-    SUPPORTED_METHODS = [
-        'GET',
-        'POST',
-        'HEAD'
-    ]
+class MoveDistanceAction(webthing.Action):
+    def __init__(self, thing, input_):
+        webthing.Action.__init__(
+            self,
+            uuid.uuid4().hex,
+            thing,
+            'moveDistance',
+            input_=input_
+        )
 
-    def initialize(self, host):
-        self.host = host
+    @staticmethod
+    def check(thing, input_):
+        index = int(input_['motor'][1:]) - 1
+        if thing.core.motors[index] is None:
+            raise ValueError(input_['motor'] + ' is no motor')
 
-    async def get(self, *args):
-        body = self.request.body
-        if not body:
-            body = None
+    def start(self):
+        # Finished by the acquisition thread once the motor reached the
+        # distance.
+        self.status = 'pending'
+        self.thing.action_notify(self)
+        self.perform_action()
 
-        # X-Forwarded-For or similar headers
-        req = HTTPRequest(
-            url='http://' + self.host + '/' + args[0] + '?' + self.request.query,
-            headers=self.request.headers,
-            body=body,
-            method=self.request.method
-        )
-        response = await self.client.fetch(req)
-        self.set_status(response.code, response.reason)
-        for header, v in response.headers.get_all():
-            if header is 'Content-Type':
-                self.set_header(header, v)
-            elif header not in ('Content-Length', 'Transfer-Encoding', 'Content-Encoding', 'Connection'):
-                self.add_header(header, v)
-        if response.body:
-            self.set_header('Content-Length', len(response.body))
-            # TODO re-write /favicon.ico, / etc.
-            self.write(response.body)
-        self.finish()
+    def perform_action(self):
+        index = int(self.input['motor'][1:]) - 1
+        if not self.thing.core.moveDistance(
+            index,
+            self.input['distance'],
+            self.input.get('speed', 512),
+            self
+        ):
+            # The output was changed or the server stopped since.
+            self.thing.action_failed(self)
 
-    async def post(self, *args):
-        return self.get(*args)
+    def cancel(self):
+        self.thing.core.stopMovement(self)
 
-    async def head(self, *args):
-        return self.get(*args)
 
+class ButtonEvent(webthing.Event):
+    def __init__(self, thing, kind, button, at, data=None):
+        webthing.Event.__init__(self, thing, kind + 'Event' + button, data)
+        # Time of the edge instead of when the event was raised, with
+        # milliseconds.
+        self.time = datetime.datetime.utcfromtimestamp(at).strftime(
+            '%Y-%m-%dT%H:%M:%S.%f'
+        )[:-3] + '+00:00'
 
-class ServerThread(threading.Thread):
-    def __init__(self, server):
-        super(ServerThread, self).__init__()
-        self.server = server
 
-    def run(self):
-        self.event_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.event_loop)
-        self.server.start()
+class ConfigurationChangedEvent(webthing.Event):
+    def __init__(self, thing, port, type):
+        webthing.Event.__init__(
+            self,
+            thing,
+            'configurationChanged',
+            data={
+                'port': port,
+                'type': type
+            }
+        )
 
 
-    def stop(self):
-        self.server.stop()
-        self.event_loop.stop()
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
 
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Last count is for values above the largest bucket.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
 
-class wotApplication(TouchApplication):
-    COLOR_MAP = {
-        'rot': '#ff0000',
-        'blau': '#0000ff',
-        'weiss': '#ffffff'
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics(object):
+    BUCKETS = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1, 2.5
+    )
+    PREFIX = 'wot_'
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # Keyed by name and a tuple of label pairs. Updates from different
+        # threads are not locked, an occasionally lost sample is fine here.
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        if not enabled:
+            # Keep the hooks as cheap as possible.
+            self.observe = self.ignore
+            self.increment = self.ignore
+
+    def ignore(self, *args):
+        pass
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def observe(self, name, value, labels=None):
+        key = (name, self.key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(
+                key, Histogram(self.BUCKETS)
+            )
+        histogram.observe(value)
+
+    def increment(self, name, amount=1, labels=None):
+        key = (name, self.key(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, callback, labels=None):
+        self.gauges[(name, self.key(labels))] = callback
+
+    def timed(self, name, function, labels=None):
+        # Wraps function to observe its duration, unchanged when disabled.
+        if not self.enabled:
+            return function
+        histogram = Histogram(self.BUCKETS)
+        histogram = self.histograms.setdefault(
+            (name, self.key(labels)),
+            histogram
+        )
+        clock = time.perf_counter
+
+        def timedFunction(*args):
+            started = clock()
+            try:
+                return function(*args)
+            finally:
+                histogram.observe(clock() - started)
+        return timedFunction
+
+    def process(self):
+        # Resident memory and CPU time of this process from /proc.
+        result = {}
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        result['process_resident_memory_bytes'] = \
+                            int(line.split()[1]) * 1024
+            with open('/proc/self/stat') as stat:
+                # The command may contain spaces, skip past it.
+                fields = stat.read().rsplit(')', 1)[1].split()
+            ticks = os.sysconf('SC_CLK_TCK')
+            result['process_cpu_seconds_total'] = \
+                (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, IndexError, ValueError):
+            pass
+        return result
+
+    def gaugeValues(self):
+        values = []
+        for (name, labels), callback in list(self.gauges.items()):
+            try:
+                values.append((name, labels, callback()))
+            except Exception:
+                traceback.print_exc()
+        for name, value in self.process().items():
+            values.append((name, (), value))
+        return values
+
+    def json(self):
+        def entry(labels, **data):
+            data['labels'] = dict(labels)
+            return data
+
+        result = {
+            'histograms': {},
+            'counters': {},
+            'gauges': {}
+        }
+        for (name, labels), histogram in list(self.histograms.items()):
+            result['histograms'].setdefault(name, []).append(entry(
+                labels,
+                count=histogram.count,
+                sum=histogram.sum,
+                buckets=histogram.cumulative()
+            ))
+        for (name, labels), value in list(self.counters.items()):
+            result['counters'].setdefault(name, []).append(
+                entry(labels, value=value)
+            )
+        for name, labels, value in self.gaugeValues():
+            result['gauges'].setdefault(name, []).append(
+                entry(labels, value=value)
+            )
+        return result
+
+    @staticmethod
+    def labelText(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join(
+            key + '="' + str(value).replace('\\', '\\\\')
+            .replace('"', '\\"') + '"'
+            for key, value in labels
+        ) + '}'
+
+    def prometheus(self):
+        lines = []
+        types = set()
+
+        def declare(name, type):
+            if name not in types:
+                types.add(name)
+                lines.append('# TYPE ' + name + ' ' + type)
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            name = self.PREFIX + name
+            declare(name, 'histogram')
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    name + '_bucket' +
+                    self.labelText(labels, [('le', repr(bound))]) +
+                    ' ' + str(count)
+                )
+            lines.append(
+                name + '_bucket' +
+                self.labelText(labels, [('le', '+Inf')]) +
+                ' ' + str(histogram.count)
+            )
+            lines.append(
+                name + '_sum' + self.labelText(labels) +
+                ' ' + repr(histogram.sum)
+            )
+            lines.append(
+                name + '_count' + self.labelText(labels) +
+                ' ' + str(histogram.count)
+            )
+        for (name, labels), value in sorted(self.counters.items()):
+            name = self.PREFIX + name
+            declare(name, 'counter')
+            lines.append(name + self.labelText(labels) + ' ' + repr(value))
+        for name, labels, value in sorted(self.gaugeValues()):
+            name = self.PREFIX + name
+            declare(name, 'counter' if name.endswith('_total') else 'gauge')
+            lines.append(name + self.labelText(labels) + ' ' + repr(value))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, metrics):
+        self.metrics = metrics
+
+    def get(self, format):
+        if not self.metrics.enabled:
+            self.set_status(404)
+            return
+        self.set_header('Cache-Control', 'no-cache')
+        if format:
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps(self.metrics.json()))
+        else:
+            self.set_header('Content-Type', 'text/plain; version=0.0.4')
+            self.write(self.metrics.prometheus())
+
+
+class PropertyHistory(object):
+    def __init__(self, size):
+        self.size = size
+        # Ring buffers of timestamps and values, oldest sample at index once
+        # full.
+        self.timestamps = array.array('d', bytes(8 * size))
+        self.values = array.array('d', bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.timestamps[self.index] = timestamp
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def samples(self, start=None, end=None):
+        # Returns timestamps and values in order, optionally limited to a
+        # time range.
+        if self.count < self.size:
+            timestamps = self.timestamps[:self.count]
+            values = self.values[:self.count]
+        else:
+            timestamps = self.timestamps[self.index:] + \
+                self.timestamps[:self.index]
+            values = self.values[self.index:] + self.values[:self.index]
+        first = 0 if start is None else bisect.bisect_left(timestamps, start)
+        last = len(timestamps) if end is None \
+            else bisect.bisect_right(timestamps, end)
+        return timestamps[first:last], values[first:last]
+
+
+def aggregate(timestamps, values, start, end, buckets):
+    # Min, max and mean of the samples in equally sized time buckets, None for
+    # empty buckets.
+    import numpy
+
+    timestamps = numpy.array(timestamps, dtype=numpy.float64)
+    values = numpy.array(values, dtype=numpy.float64)
+    width = (end - start) / buckets
+    index = ((timestamps - start) / width).astype(numpy.intp)
+    numpy.clip(index, 0, buckets - 1, out=index)
+    counts = numpy.bincount(index, minlength=buckets)
+    sums = numpy.bincount(index, weights=values, minlength=buckets)
+    filled = counts > 0
+
+    mean = numpy.full(buckets, numpy.nan)
+    minimum = numpy.full(buckets, numpy.nan)
+    maximum = numpy.full(buckets, numpy.nan)
+    if len(values):
+        # The samples are sorted by time, so every bucket is a slice.
+        starts = numpy.searchsorted(index, numpy.nonzero(filled)[0])
+        mean[filled] = sums[filled] / counts[filled]
+        minimum[filled] = numpy.minimum.reduceat(values, starts)
+        maximum[filled] = numpy.maximum.reduceat(values, starts)
+
+    def toList(result):
+        return [None if math.isnan(x) else x for x in result.tolist()]
+    return {
+        'timestamps': (start + numpy.arange(buckets) * width).tolist(),
+        'min': toList(minimum),
+        'max': toList(maximum),
+        'mean': toList(mean),
+        'count': counts.tolist()
     }
 
-    def __init__(self, args):
-        TouchApplication.__init__(self, args)
 
-        self.w = TouchWindow('WebOfTXT')
+class EventRecord(object):
+    # What is kept of an event once subscribers were notified.
+    __slots__ = ('name', 'data', 'time', 'created')
+
+    def __init__(self, event):
+        self.name = event.get_name()
+        self.data = event.get_data()
+        self.time = event.get_time()
+        self.created = time.time()
+
+    def get_name(self):
+        return self.name
+
+    def as_event_description(self):
+        description = {
+            'timestamp': self.time
+        }
+        if self.data is not None:
+            description['data'] = self.data
+        return {
+            self.name: description
+        }
+
+
+class ActionRecord(object):
+    # Replaces completed actions, which keep references to the thing.
+    __slots__ = (
+        'id',
+        'name',
+        'href',
+        'input',
+        'status',
+        'time_requested',
+        'time_completed',
+        'created'
+    )
+
+    def __init__(self, action):
+        self.id = action.get_id()
+        self.name = action.get_name()
+        self.href = action.get_href()
+        self.input = action.get_input()
+        self.status = action.get_status()
+        self.time_requested = action.get_time_requested()
+        self.time_completed = action.get_time_completed()
+        self.created = getattr(action, 'created', 0)
+
+    def get_id(self):
+        return self.id
+
+    def get_name(self):
+        return self.name
+
+    def cancel(self):
+        pass
+
+    def as_action_description(self):
+        description = {
+            'href': self.href,
+            'timeRequested': self.time_requested,
+            'status': self.status
+        }
+        if self.input is not None:
+            description['input'] = self.input
+        if self.time_completed is not None:
+            description['timeCompleted'] = self.time_completed
+        return {
+            self.name: description
+        }
+
+
+class TXTThing(webthing.Thing):
+    HISTORY_TYPES = ['number', 'integer', 'boolean']
+
+    def __init__(
+        self,
+        name,
+        type_=[],
+        description='',
+        history_size=3600,
+        max_events=1000,
+        max_actions=100,
+        max_age=86400
+    ):
+        webthing.Thing.__init__(self, name, type_, description)
+        self.pending = threading.local()
+        # Samples kept per numeric or boolean property, 0 disables history.
+        self.history_size = history_size
+        self.histories = {}
+        self.metrics = Metrics()
+        # Events and completed actions per name are dropped once there are
+        # more than this or they are older than max_age seconds.
+        self.events = collections.deque(maxlen=max_events)
+        self.max_actions = max_actions
+        self.max_age = max_age
+        # Serialized description per websocket href and properties snapshot,
+        # rebuilt after changes.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.description_cache = {}
+        self.properties_cache = None
+        self.properties_version = 0
+        self.property_versions = {}
+        # Numeric keys of the properties in binary frames, published in the
+        # thing description. A name keeps its index while the server runs.
+        self.property_indices = {}
+
+    def invalidate_description(self):
+        self.description_cache = {}
+        self.invalidate_properties()
+
+    def invalidate_properties(self):
+        self.properties_version += 1
+        self.properties_cache = None
+
+    def etag(self, version):
+        return '"' + self.epoch + '-' + str(version) + '"'
+
+    def description_json(self, ws_href):
+        cached = self.description_cache.get(ws_href)
+        if cached is None:
+            description = self.as_thing_description()
+            description['links'].append({
+                'rel': 'alternate',
+                'href': ws_href + self.get_href()
+            })
+            body = json.dumps(description).encode()
+            cached = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+            # One entry per host name the thing is reached by.
+            if len(self.description_cache) >= 8:
+                self.description_cache = {}
+            self.description_cache[ws_href] = cached
+        return cached
+
+    def properties_json(self):
+        if self.properties_cache is None:
+            self.properties_cache = (
+                json.dumps(self.get_properties()).encode(),
+                self.etag(self.properties_version)
+            )
+        return self.properties_cache
+
+    def property_etag(self, name):
+        return self.etag(self.property_versions.get(name, 0))
+
+    def changed(self, name):
+        self.property_versions[name] = \
+            self.property_versions.get(name, 0) + 1
+        self.invalidate_properties()
+
+    def add_property(self, property_):
+        self.property_indices.setdefault(
+            property_.name,
+            len(self.property_indices)
+        )
+        webthing.Thing.add_property(self, property_)
+        self.changed(property_.name)
+        self.invalidate_description()
+
+    def get_property_descriptions(self):
+        descriptions = webthing.Thing.get_property_descriptions(self)
+        for name, description in descriptions.items():
+            description['index'] = self.property_indices[name]
+        return descriptions
+
+    def add_available_action(self, name, metadata, cls):
+        webthing.Thing.add_available_action(self, name, metadata, cls)
+        self.invalidate_description()
+
+    def add_available_event(self, name, metadata):
+        webthing.Thing.add_available_event(self, name, metadata)
+        self.invalidate_description()
+
+    def remove_available_event(self, name):
+        self.available_events.pop(name, None)
+        self.invalidate_description()
 
+    def add_type(self, type_):
+        if type_ not in self.type:
+            self.type.append(type_)
+            self.invalidate_description()
+
+    def set_ui_href(self, href):
+        webthing.Thing.set_ui_href(self, href)
+        self.invalidate_description()
+
+    def expired(self):
+        return time.time() - self.max_age if self.max_age else 0
+
+    def add_event(self, event):
+        self.events.append(EventRecord(event))
+        self.prune_events()
+        self.event_notify(event)
+
+    def prune_events(self):
+        expired = self.expired()
+        while self.events and self.events[0].created < expired:
+            self.events.popleft()
+
+    def perform_action(self, action_name, input_=None):
+        # Action classes may reject an input the schema can not, by raising
+        # ValueError from check. It is only called with a valid input.
+        action_type = self.available_actions.get(action_name)
+        check = getattr(action_type and action_type['class'], 'check', None)
+        if check is not None:
+            try:
+                if 'input' in action_type['metadata']:
+                    jsonschema.validate(
+                        input_,
+                        action_type['metadata']['input']
+                    )
+                check(self, input_)
+            except (jsonschema.ValidationError, ValueError):
+                return None
+        action = webthing.Thing.perform_action(self, action_name, input_)
+        if action is not None:
+            action.created = time.time()
+        return action
+
+    def action_failed(self, action):
+        # Ends an action that could not be performed, webthing only knows
+        # completed ones.
+        action.status = 'error'
+        action.time_completed = webthing.utils.timestamp()
+        self.action_notify(action)
+
+    def action_notify(self, action):
+        webthing.Thing.action_notify(self, action)
+        if action.get_status() in ('completed', 'error'):
+            actions = self.actions.get(action.get_name(), [])
+            for index, entry in enumerate(actions):
+                if entry is action:
+                    actions[index] = ActionRecord(action)
+                    break
+            self.prune_actions(action.get_name())
+
+    def prune_actions(self, action_name):
+        actions = self.actions.get(action_name)
+        if not actions:
+            return
+        expired = self.expired()
+        completed = [
+            entry for entry in actions if isinstance(entry, ActionRecord)
+        ]
+        drop = len(completed) - self.max_actions
+        for entry in completed:
+            if drop > 0 or entry.created < expired:
+                actions.remove(entry)
+                drop -= 1
+
+    def remove_property(self, property_):
+        webthing.Thing.remove_property(self, property_)
+        # A property added under the same name may have a different type.
+        self.histories.pop(property_.name, None)
+        self.changed(property_.name)
+        self.invalidate_description()
+
+    def record(self, property_):
+        history = self.histories.get(property_.name)
+        if history is None:
+            if not self.history_size or \
+                    property_.metadata.get('type') not in self.HISTORY_TYPES:
+                return
+            history = PropertyHistory(self.history_size)
+            self.histories[property_.name] = history
+        value = property_.get_value()
+        if value is not None:
+            history.append(time.time(), float(value))
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Collect property changes made by this thread and send them as one
+        # propertyStatus message per subscriber.
+        self.pending.data = collections.OrderedDict()
         try:
-            self.txt = ftrobopy.ftrobopy('localhost', 65000)
-        except:
-            self.txt = None
+            yield
+        finally:
+            data = self.pending.data
+            self.pending.data = None
+            if data:
+                self.notify_properties(data)
 
-        self.outputs = [
-            self.txt.C_OUTPUT,
-            self.txt.C_OUTPUT,
-            self.txt.C_OUTPUT,
-            self.txt.C_OUTPUT
+    def property_notify(self, property_):
+        self.changed(property_.name)
+        self.record(property_)
+        data = getattr(self.pending, 'data', None)
+        if data is not None:
+            data[property_.name] = property_.get_value()
+        else:
+            self.notify_properties({property_.name: property_.get_value()})
+
+    def encode_frame(self, data):
+        # Packs numeric and boolean values into a binary frame of a float64
+        # timestamp followed by (uint16 index, float64 value) pairs, all
+        # little endian. Everything else is returned to be sent as JSON.
+        values = []
+        rest = collections.OrderedDict()
+        for name, value in data.items():
+            if value is None:
+                value = math.nan
+            if isinstance(value, (bool, int, float)) and \
+                    name in self.property_indices:
+                values.append(self.property_indices[name])
+                values.append(value)
+            else:
+                rest[name] = value
+        if not values:
+            return None, rest
+        frame = struct.pack(
+            '<d' + 'Hd' * (len(values) // 2),
+            time.time(),
+            *values
+        )
+        return frame, rest
+
+    def notify_properties(self, data):
+        self.metrics.increment('notifications_total', len(data))
+        message = None
+        encoded = None
+        for subscriber in list(self.subscribers):
+            try:
+                if getattr(subscriber, 'binary', False):
+                    if encoded is None:
+                        frame, rest = self.encode_frame(data)
+                        encoded = (frame, json.dumps({
+                            'messageType': 'propertyStatus',
+                            'data': rest
+                        }) if rest else None)
+                    frame, rest = encoded
+                    if frame is not None:
+                        subscriber.write_message(frame, binary=True)
+                    if rest is not None:
+                        subscriber.write_message(rest)
+                else:
+                    if message is None:
+                        message = json.dumps({
+                            'messageType': 'propertyStatus',
+                            'data': data
+                        })
+                    subscriber.write_message(message)
+            except tornado.websocket.WebSocketClosedError:
+                pass
+
+
+class ChangeDetector(object):
+    def __init__(self, threshold=0.005, delta=16, step=4):
+        # A frame changed once more than threshold of the pixels of every
+        # step-th row and column moved by more than delta gray levels since
+        # the last changed frame. A threshold of 0 takes every frame.
+        self.threshold = threshold
+        self.delta = delta
+        self.step = step
+        self.reference = None
+
+    def reset(self):
+        self.reference = None
+
+    def changed(self, frame):
+        if not self.threshold:
+            return True
+        # Sum of the color channels as gray, compared against the last
+        # changed frame so slow drift adds up.
+        small = frame[::self.step, ::self.step].sum(axis=2, dtype='int16')
+        reference = self.reference
+        if reference is None or reference.shape != small.shape or \
+                (abs(small - reference) > self.delta * 3).mean() > \
+                self.threshold:
+            self.reference = small
+            return True
+        return False
+
+
+class CameraStream(object):
+    def __init__(
+        self,
+        cam,
+        idle_timeout=10,
+        max_age=0.5,
+        metrics=None,
+        threshold=0.005,
+        callback=None
+    ):
+        self.cam = cam
+        self.metrics = metrics or Metrics()
+        self.labels = {'camera': cam}
+        self.detector = ChangeDetector(threshold)
+        # Called from the capture thread with the sequence of changed frames.
+        self.callback = callback
+        # Seconds without requests or viewers until the camera is released.
+        self.idle_timeout = idle_timeout
+        # Seconds a frame may be reused for snapshots.
+        self.max_age = max_age
+        self.subscribers = set()
+        self.waiters = []
+        self.io_loop = None
+        self.lock = threading.Lock()
+        self.capture = None
+        self.previous = None
+        self.last_demand = 0
+        self.jpeg = None
+        # Last changed frame and its thumbnail as (sequence, jpeg), which
+        # is only encoded once requested.
+        self.frame = None
+        self.thumbnail = None
+        self.captured = 0
+        self.sequence = 0
+        # Smoothed frames per second of the running capture.
+        self.fps = 0
+        self.last_frame = None
+        # Keeps ETags from a previous run from matching new frames.
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def demand(self):
+        # Starts capturing if the camera is idle.
+        with self.lock:
+            self.last_demand = time.time()
+            if self.capture is None:
+                self.fps = 0
+                self.last_frame = None
+                self.detector.reset()
+                self.capture = CameraCapture(self, self.previous)
+                self.previous = self.capture
+                self.capture.start()
+
+    def idle(self, capture):
+        # Called by the capture thread, returns True once it should stop.
+        with self.lock:
+            if capture.stopped.is_set() or (
+                not self.subscribers and
+                time.time() - self.last_demand > self.idle_timeout
+            ):
+                if self.capture is capture:
+                    self.capture = None
+                return True
+            return False
+
+    def stop(self):
+        with self.lock:
+            if self.capture is not None:
+                self.capture.stop()
+                self.capture = None
+
+    def subscribe(self, handler):
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self.subscribers.add(handler)
+        self.demand()
+        # Frames are only sent on change, start with the current one.
+        with self.lock:
+            jpeg = self.jpeg
+        if jpeg is not None:
+            handler.send_frame(jpeg)
+
+    def unsubscribe(self, handler):
+        self.subscribers.discard(handler)
+        self.last_demand = time.time()
+
+    def next_frame(self):
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        future = tornado.concurrent.Future()
+        self.waiters.append(future)
+        self.demand()
+        return future
+
+    def latest(self):
+        with self.lock:
+            return self.sequence, self.jpeg, self.captured
+
+    async def latest_thumbnail(self):
+        with self.lock:
+            sequence = self.sequence
+            frame = self.frame
+            thumbnail = self.thumbnail
+        if frame is None:
+            return sequence, None
+        if thumbnail is None or thumbnail[0] != sequence:
+            # Encoding would block the server loop.
+            jpeg = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None,
+                encode_thumbnail,
+                frame
+            )
+            thumbnail = (sequence, jpeg)
+            with self.lock:
+                if self.sequence == sequence:
+                    self.thumbnail = thumbnail
+        return thumbnail
+
+    def fresh(self):
+        with self.lock:
+            return self.jpeg is not None and \
+                time.time() - self.captured <= self.max_age
+
+    def etag(self, sequence, variant=''):
+        return '"' + self.epoch + '-' + str(sequence) + variant + '"'
+
+    def count_frame(self):
+        # Must hold the lock.
+        self.captured = time.time()
+        if self.last_frame is not None:
+            interval = max(self.captured - self.last_frame, 0.001)
+            self.fps += 0.2 * (1 / interval - self.fps)
+        self.last_frame = self.captured
+
+    def publish(self, jpeg, frame=None):
+        # Called from the capture thread, hand the frame to the server loop.
+        with self.lock:
+            self.jpeg = jpeg
+            self.frame = frame
+            self.thumbnail = None
+            self.sequence += 1
+            sequence = self.sequence
+            self.count_frame()
+        if self.callback is not None:
+            self.callback(sequence)
+        if self.subscribers or self.waiters:
+            self.io_loop.add_callback(self.broadcast, jpeg)
+
+    def unchanged(self):
+        # Called from the capture thread for frames that look like the last
+        # one, which stays current without being encoded or sent again.
+        with self.lock:
+            if self.jpeg is None:
+                return
+            self.count_frame()
+        self.metrics.increment('camera_frames_skipped_total', 1, self.labels)
+        if self.waiters:
+            self.io_loop.add_callback(self.broadcast, self.jpeg, False)
+
+    def broadcast(self, jpeg, subscribers=True):
+        waiters = self.waiters
+        self.waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(jpeg)
+        if subscribers:
+            for subscriber in list(self.subscribers):
+                subscriber.send_frame(jpeg)
+
+
+def encode_thumbnail(frame, size=(160, 120)):
+    # Only called once a capture imported OpenCV.
+    import cv2
+    ok, encoded = cv2.imencode(
+        '.jpg',
+        cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    )
+    return encoded.tobytes() if ok else None
+
+
+class CameraCapture(threading.Thread):
+    def __init__(self, stream, previous=None):
+        super(CameraCapture, self).__init__()
+        self.daemon = True
+        self.stream = stream
+        self.previous = previous
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Importing OpenCV takes seconds on the TXT, only do so once a camera
+        # is actually used.
+        import cv2
+
+        # The device can only be opened once the last capture released it.
+        if self.previous is not None:
+            self.previous.join()
+            self.previous = None
+        capture = cv2.VideoCapture(self.stream.cam)
+        if capture.isOpened():
+            capture.set(3, 320)
+            capture.set(4, 240)
+            capture.set(5, 10)
+        metrics = self.stream.metrics
+        labels = self.stream.labels
+        read = metrics.timed('camera_capture_seconds', capture.read, labels)
+        encode = metrics.timed('camera_encode_seconds', cv2.imencode, labels)
+        detector = self.stream.detector
+        try:
+            while not self.stream.idle(self):
+                # Blocks until the camera delivers the next frame.
+                ok, frame = read()
+                if not ok:
+                    self.stopped.wait(0.1)
+                    continue
+                if not detector.changed(frame):
+                    self.stream.unchanged()
+                    continue
+                ok, encoded = encode('.jpg', frame)
+                if not ok:
+                    detector.reset()
+                    continue
+                self.stream.publish(encoded.tobytes(), frame)
+        finally:
+            capture.release()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class CameraFrameHandler(tornado.web.RequestHandler):
+    CHUNK_SIZE = 16384
+    TIMEOUT = 5
+
+    def initialize(self, streams):
+        self.streams = streams
+
+    async def get(self, cam, thumbnail=None):
+        stream = self.streams.get(int(cam))
+        if stream is None:
+            raise tornado.web.HTTPError(404)
+        if stream.fresh():
+            stream.demand()
+        else:
+            try:
+                await tornado.gen.with_timeout(
+                    datetime.timedelta(seconds=self.TIMEOUT),
+                    stream.next_frame()
+                )
+            except tornado.gen.TimeoutError:
+                pass
+        if thumbnail is None:
+            sequence, jpeg, captured = stream.latest()
+        else:
+            sequence, jpeg = await stream.latest_thumbnail()
+        if jpeg is None:
+            raise tornado.web.HTTPError(503)
+
+        self.set_header('ETag', stream.etag(sequence, thumbnail or ''))
+        self.set_header('Cache-Control', 'no-cache')
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        self.set_header('Content-Type', 'image/jpeg')
+        self.set_header('Content-Length', len(jpeg))
+        if self.request.method == 'HEAD':
+            return
+        # RequestHandler.write only takes bytes and joins its buffer, so
+        # send the headers and hand slices of the frame to the connection.
+        self.flush()
+        view = memoryview(jpeg)
+        for start in range(0, len(view), self.CHUNK_SIZE):
+            self.request.connection.write(view[start:start + self.CHUNK_SIZE])
+
+    async def head(self, cam, thumbnail=None):
+        await self.get(cam, thumbnail)
+
+
+class MJPEGHandler(tornado.web.RequestHandler):
+    BOUNDARY = 'wotframe'
+
+    def initialize(self, streams):
+        self.streams = streams
+        self.stream = None
+        self.sending = False
+        self.closed = tornado.locks.Event()
+
+    async def get(self, cam):
+        self.stream = self.streams.get(int(cam))
+        if self.stream is None:
+            raise tornado.web.HTTPError(404)
+
+        self.set_header(
+            'Content-Type',
+            'multipart/x-mixed-replace; boundary=' + self.BOUNDARY
+        )
+        self.set_header('Cache-Control', 'no-cache')
+        self.stream.subscribe(self)
+        await self.closed.wait()
+
+    def send_frame(self, jpeg):
+        # Drop frames for viewers that have not received the last one yet.
+        if self.sending or self.closed.is_set():
+            return
+        self.write(
+            b'--' + self.BOUNDARY.encode() + b'\r\n' +
+            b'Content-Type: image/jpeg\r\n' +
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n'
+        )
+        self.write(jpeg)
+        self.write(b'\r\n')
+        self.sending = True
+        self.flush().add_done_callback(self.on_flushed)
+
+    def on_flushed(self, future):
+        self.sending = False
+        if future.exception() is not None:
+            self.on_connection_close()
+
+    def on_connection_close(self):
+        if self.stream is not None:
+            self.stream.unsubscribe(self)
+        self.closed.set()
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.mktime_tz(email.utils.parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class CachedResponse(object):
+    __slots__ = (
+        'headers',
+        'body',
+        'etag',
+        'upstream_etag',
+        'last_modified',
+        'expires'
+    )
+
+    def __init__(self, headers, body, etag, upstream_etag, last_modified):
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.upstream_etag = upstream_etag
+        self.last_modified = last_modified
+        self.expires = 0
+
+
+class ProxyCache(object):
+    # Heuristic freshness is capped for responses that only have a date.
+    MAX_HEURISTIC_LIFETIME = 86400
+
+    def __init__(self, max_size=4 * 1024 * 1024, max_entry_size=512 * 1024):
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.discard(key)
+        if len(entry.body) > self.max_entry_size:
+            return
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+    def lifetime(self, headers):
+        # Seconds the response stays fresh or None if it may not be stored.
+        directives = {}
+        for directive in headers.get('Cache-Control', '').split(','):
+            name, _, v = directive.strip().partition('=')
+            directives[name.lower()] = v.strip('"')
+        # Cached responses are fetched without Accept-Encoding, so only
+        # ones that vary by nothing else can be served to every client.
+        vary = [
+            name.strip().lower()
+            for name in headers.get('Vary', '').split(',')
+            if name.strip()
+        ]
+        if 'no-store' in directives or 'private' in directives or \
+                'Set-Cookie' in headers or \
+                any(name != 'accept-encoding' for name in vary):
+            return None
+        if 'no-cache' in directives:
+            return 0
+        for name in ('s-maxage', 'max-age'):
+            if name in directives:
+                try:
+                    return max(int(directives[name]), 0)
+                except ValueError:
+                    return 0
+        date = parse_http_date(headers.get('Date', '')) or time.time()
+        if 'Expires' in headers:
+            expires = parse_http_date(headers['Expires'])
+            return max(expires - date, 0) if expires is not None else 0
+        last_modified = parse_http_date(headers.get('Last-Modified', ''))
+        if last_modified is not None:
+            return min(
+                (date - last_modified) / 10, self.MAX_HEURISTIC_LIFETIME
+            )
+        return 0
+
+
+class UpstreamPool(object):
+    # Keeps idle connections to the cfw web server open between proxy
+    # requests.
+    CONNECT_TIMEOUT = 20
+
+    def __init__(self, host, max_idle=4):
+        host, _, port = host.partition(':')
+        self.host = host
+        self.port = int(port or 80)
+        self.max_idle = max_idle
+        self.idle = []
+        self.client = tornado.tcpclient.TCPClient()
+
+    def get_idle(self):
+        while self.idle:
+            stream = self.idle.pop()
+            if not stream.closed():
+                return stream
+        return None
+
+    async def connect(self):
+        return await tornado.gen.with_timeout(
+            datetime.timedelta(seconds=self.CONNECT_TIMEOUT),
+            self.client.connect(self.host, self.port)
+        )
+
+    def release(self, stream):
+        if stream.closed():
+            return
+        if len(self.idle) >= self.max_idle:
+            stream.close()
+        else:
+            self.idle.append(stream)
+
+
+class UpstreamDelegate(tornado.httputil.HTTPMessageDelegate):
+    def __init__(self, handler):
+        self.handler = handler
+
+    def headers_received(self, start_line, headers):
+        self.handler.on_upstream_headers(start_line, headers)
+
+    def data_received(self, chunk):
+        # The connection waits for the returned future before it reads the
+        # next chunk from upstream.
+        return self.handler.on_upstream_chunk(chunk)
+
+
+class ReverseProxyHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = (
+        'GET',
+        'HEAD',
+        'POST',
+        'PUT',
+        'DELETE',
+        'PATCH',
+        'OPTIONS'
+    )
+    HOP_HEADERS = (
+        'Connection',
+        'Keep-Alive',
+        'Proxy-Authenticate',
+        'Proxy-Authorization',
+        'Proxy-Connection',
+        'Te',
+        'Trailer',
+        'Transfer-Encoding',
+        'Upgrade'
+    )
+    # Not stored with cached responses, they are set when serving them.
+    UNCACHED_HEADERS = HOP_HEADERS + ('Content-Length', 'Date', 'Etag')
+
+    PARAMS = tornado.http1connection.HTTP1ConnectionParameters(
+        header_timeout=20,
+        # Bodies are streamed, so their size does not matter.
+        max_body_size=1 << 62
+    )
+
+    def initialize(self, upstream, cache=None, metrics=None):
+        self.upstream = upstream
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+        self.upstream_start = None
+        self.upstream_headers = tornado.httputil.HTTPHeaders()
+        # Body chunks collected for the cache, None if not caching.
+        self.capture = None
+        self.capture_size = 0
+        self.capture_lifetime = 0
+        self.key = None
+        self.stale = None
+        self.revalidated = False
+        # Set while the headers are held back until the ETag of the body
+        # is known.
+        self.deferred = False
+        self.suppress_body = False
+        self.connection = None
+        # Set once the client went away while the response was streamed.
+        self.aborted = False
+
+    def compute_etag(self):
+        # Streamed responses are not hashed, cached ones set their own ETag.
+        return None
+
+    async def proxy(self, path):
+        key = self.key = path + '?' + self.request.query
+        method = self.request.method
+        entry = None
+        if self.cache is not None:
+            if method in ('GET', 'HEAD'):
+                entry = self.cache.get(key)
+            else:
+                self.cache.discard(key)
+        if entry is not None and entry.expires > time.time():
+            self.send_cached(entry)
+            return
+
+        headers = tornado.httputil.HTTPHeaders()
+        for header, v in self.request.headers.get_all():
+            if header not in self.HOP_HEADERS:
+                headers.add(header, v)
+        headers['X-Forwarded-For'] = self.request.remote_ip
+        headers['X-Forwarded-Host'] = self.request.host
+        headers['X-Forwarded-Proto'] = self.request.protocol
+
+        if self.cache is not None and method == 'GET' and \
+                'Authorization' not in headers and 'Range' not in headers:
+            # Fetch a full, unencoded response for the cache, conditional
+            # requests from the client are answered here.
+            for header in ('If-None-Match', 'If-Modified-Since',
+                           'Accept-Encoding'):
+                if header in headers:
+                    del headers[header]
+            if entry is not None:
+                self.stale = entry
+                if entry.upstream_etag is not None:
+                    headers['If-None-Match'] = entry.upstream_etag
+                if entry.last_modified is not None:
+                    headers['If-Modified-Since'] = entry.last_modified
+            self.capture = []
+
+        body = self.request.body
+        if body or method in ('POST', 'PUT', 'PATCH'):
+            headers['Content-Length'] = str(len(body))
+        else:
+            body = None
+
+        target = '/' + path
+        if self.request.query:
+            target += '?' + self.request.query
+        start_line = tornado.httputil.RequestStartLine(
+            method,
+            target,
+            'HTTP/1.1'
+        )
+        complete = False
+        try:
+            # An idle connection may have been closed by the server in the
+            # meantime, retry those once on a new connection.
+            stream = self.upstream.get_idle()
+            if stream is not None:
+                complete = await self.fetch(stream, start_line, headers, body)
+            if not complete and self.upstream_start is None:
+                stream = await self.upstream.connect()
+                complete = await self.fetch(stream, start_line, headers, body)
+        except Exception:
+            if self._headers_written:
+                raise
+        if self.revalidated:
+            self.send_cached(self.stale)
+            return
+        if not complete and not self._headers_written:
+            raise tornado.web.HTTPError(502)
+        if self.capture is not None and complete:
+            entry = self.store(key)
+            if self.deferred:
+                self.send_cached(entry)
+                return
+        if complete:
+            self.finish()
+        elif not self._finished:
+            # The response was cut off, do not let it look complete.
+            self.request.connection.close()
+
+    async def fetch(self, stream, start_line, headers, body):
+        # Returns whether the whole response was received.
+        self.connection = connection = tornado.http1connection.HTTP1Connection(
+            stream,
+            True,
+            self.PARAMS
+        )
+        try:
+            connection.write_headers(start_line, headers, body)
+            connection.finish()
+            complete = await connection.read_response(UpstreamDelegate(self))
+        except tornado.iostream.StreamClosedError:
+            complete = False
+        stream = connection.detach()
+        if complete and not self.aborted:
+            self.upstream.release(stream)
+        else:
+            stream.close()
+        return complete and not self.aborted
+
+    def store(self, key):
+        body = b''.join(self.capture)
+        upstream_etag = self.upstream_headers.get('Etag')
+        etag = upstream_etag
+        if etag is None:
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        entry = CachedResponse(
+            [
+                (header, v)
+                for header, v in self.upstream_headers.get_all()
+                if header not in self.UNCACHED_HEADERS
+            ],
+            body,
+            etag,
+            upstream_etag,
+            self.upstream_headers.get('Last-Modified')
+        )
+        entry.expires = time.time() + self.capture_lifetime
+        self.cache.put(key, entry)
+        return entry
+
+    def not_modified(self, last_modified):
+        # Expects the ETag header to be set already.
+        if 'If-None-Match' in self.request.headers:
+            return self.check_etag_header()
+        since = parse_http_date(
+            self.request.headers.get('If-Modified-Since', '')
+        )
+        modified = parse_http_date(last_modified or '')
+        return since is not None and modified is not None and \
+            modified <= since
+
+    def send_cached(self, entry):
+        self.set_status(200)
+        for header in ('Content-Type', 'Server'):
+            self.clear_header(header)
+        self.set_header('Date', tornado.httputil.format_timestamp(time.time()))
+        for header, v in entry.headers:
+            if header == 'Content-Type':
+                self.set_header(header, v)
+            else:
+                self.add_header(header, v)
+        self.set_header('ETag', entry.etag)
+        if self.not_modified(entry.last_modified):
+            self.set_status(304)
+        else:
+            self.set_header('Content-Length', len(entry.body))
+            if self.request.method != 'HEAD':
+                self.write(entry.body)
+        self.finish()
+
+    def on_upstream_headers(self, start_line, headers):
+        code = start_line.code
+        # Interim responses like 100 Continue are followed by a new status.
+        if code < 200:
+            return
+        self.upstream_start = start_line
+        self.upstream_headers = headers
+        if self.capture is not None:
+            if code == 304 and self.stale is not None:
+                lifetime = self.cache.lifetime(self.upstream_headers)
+                self.stale.expires = time.time() + (lifetime or 0)
+                self.revalidated = True
+                self.capture = None
+                return
+            lifetime = self.cache.lifetime(self.upstream_headers)
+            length = self.upstream_headers.get('Content-Length')
+            if code != 200 or lifetime is None or (
+                length is not None and
+                int(length) > self.cache.max_entry_size
+            ):
+                self.capture = None
+                self.cache.discard(self.key)
+            else:
+                self.capture_lifetime = lifetime
+                # The first client gets the ETag of the cache entry too.
+                self.deferred = 'Etag' not in self.upstream_headers
+                if self.deferred:
+                    return
+        self.send_upstream_headers()
+
+    def send_upstream_headers(self):
+        code = self.upstream_start.code
+        self.set_status(code, self.upstream_start.reason)
+        for header in ('Content-Type', 'Server', 'Date'):
+            self.clear_header(header)
+        for header, v in self.upstream_headers.get_all():
+            if header == 'Content-Type':
+                self.set_header(header, v)
+            elif header not in self.HOP_HEADERS:
+                self.add_header(header, v)
+        if self.stale is not None or self.capture is not None:
+            # Conditional headers were not forwarded, check them here.
+            if code == 200 and self.not_modified(
+                self.upstream_headers.get('Last-Modified')
+            ):
+                self.set_status(304)
+                self.suppress_body = True
+
+    async def on_upstream_chunk(self, chunk):
+        if self.revalidated:
+            return
+        if self.capture is not None:
+            self.capture.append(chunk)
+            self.capture_size += len(chunk)
+            if self.capture_size <= self.cache.max_entry_size:
+                if self.deferred:
+                    return
+            else:
+                # Too big to cache after all, stream it.
+                captured = self.capture
+                self.capture = None
+                if self.deferred:
+                    self.deferred = False
+                    self.send_upstream_headers()
+                    chunk = b''.join(captured)
+        if not self.suppress_body:
+            # TODO re-write /favicon.ico, / etc.
+            self.write(chunk)
+            try:
+                # Only read on once the client took the chunk, so slow
+                # clients do not pile up the response in memory.
+                await self.flush()
+            except tornado.iostream.StreamClosedError:
+                # Stops reading from upstream.
+                self.aborted = True
+                self.connection.close()
+
+    async def get(self, *args):
+        await self.proxy(args[0])
+
+    async def head(self, *args):
+        await self.proxy(args[0])
+
+    async def post(self, *args):
+        await self.proxy(args[0])
+
+    async def put(self, *args):
+        await self.proxy(args[0])
+
+    async def delete(self, *args):
+        await self.proxy(args[0])
+
+    async def patch(self, *args):
+        await self.proxy(args[0])
+
+    async def options(self, *args):
+        await self.proxy(args[0])
+
+    def on_finish(self):
+        self.metrics.observe(
+            'proxy_request_seconds',
+            self.request.request_time()
+        )
+
+
+class PropertyHistoryHandler(tornado.web.RequestHandler):
+    MAX_BUCKETS = 10000
+
+    def initialize(self, thing):
+        self.thing = thing
+
+    def get(self, name):
+        prop = self.thing.find_property(name)
+        if prop is None or \
+                prop.metadata.get('type') not in self.thing.HISTORY_TYPES:
+            self.set_status(404)
+            return
+
+        try:
+            start = self.get_argument('from', None)
+            start = float(start) if start is not None else None
+            end = self.get_argument('to', None)
+            end = float(end) if end is not None else None
+            buckets = self.get_argument('buckets', None)
+            buckets = int(buckets) if buckets is not None else None
+        except ValueError:
+            self.set_status(400)
+            return
+        if buckets is not None and not 0 < buckets <= self.MAX_BUCKETS:
+            self.set_status(400)
+            return
+
+        history = self.thing.histories.get(name)
+        if history is None:
+            timestamps = values = array.array('d')
+        else:
+            timestamps, values = history.samples(start, end)
+
+        if buckets is None:
+            result = {
+                'timestamps': timestamps.tolist(),
+                'values': values.tolist()
+            }
+        else:
+            if start is None:
+                start = timestamps[0] if timestamps else time.time()
+            if end is None:
+                end = time.time()
+            if end <= start:
+                self.set_status(400)
+                return
+            try:
+                result = aggregate(timestamps, values, start, end, buckets)
+            except ImportError:
+                self.set_status(501)
+                return
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(result))
+
+
+class ThingHandler(webthing.server.ThingHandler):
+    BINARY_PROTOCOL = 'webthing-binary'
+
+    def select_subprotocol(self, subprotocols):
+        if self.BINARY_PROTOCOL in subprotocols:
+            return self.BINARY_PROTOCOL
+        return None
+
+    def open(self):
+        # Property updates are sent as binary frames to subscribers that
+        # asked for them, either by subprotocol or with ?format=binary.
+        self.binary = \
+            self.selected_subprotocol == self.BINARY_PROTOCOL or \
+            self.get_argument('format', 'json') == 'binary'
+        webthing.server.ThingHandler.open(self)
+
+    @tornado.web.asynchronous
+    def get(self, thing_id='0'):
+        if self.request.headers.get('Upgrade', '').lower() == 'websocket':
+            webthing.server.ThingHandler.get(self, thing_id)
+            return
+
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            self.finish()
+            return
+
+        ws_href = '{}://{}'.format(
+            'wss' if self.request.protocol == 'https' else 'ws',
+            self.request.headers.get('Host', '')
+        )
+        body, etag = thing.description_json(ws_href)
+        self.set_header('ETag', etag)
+        if self.check_etag_header():
+            self.set_status(304)
+        else:
+            self.set_header('Content-Type', 'application/json')
+            self.write(body)
+        self.finish()
+
+
+class PropertiesHandler(webthing.server.PropertiesHandler):
+    def get(self, thing_id='0'):
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+
+        body, etag = thing.properties_json()
+        self.set_header('ETag', etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.write(body)
+
+
+class PropertyHandler(webthing.server.PropertyHandler):
+    # Seconds to wait for an output write to be applied.
+    APPLY_TIMEOUT = 2
+
+    def get(self, thing_id='0', property_name=None):
+        thing = self.get_thing(thing_id)
+        if thing is None or not thing.has_property(property_name):
+            self.set_status(404)
+            return
+
+        self.set_header('ETag', thing.property_etag(property_name))
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        webthing.server.PropertyHandler.get(self, thing_id, property_name)
+
+    async def put(self, thing_id='0', property_name=None):
+        thing = self.get_thing(thing_id)
+        prop = None if thing is None else thing.find_property(property_name)
+        if prop is None or not isinstance(prop.value, ScheduledValue):
+            webthing.server.PropertyHandler.put(self, thing_id, property_name)
+            return
+
+        # Outputs are written on the next transfer cycle, answer with the
+        # value once it was applied.
+        try:
+            args = json.loads(self.request.body.decode())
+        except ValueError:
+            self.set_status(400)
+            return
+        if not isinstance(args, dict) or property_name not in args:
+            self.set_status(400)
+            return
+        try:
+            thing.set_property(property_name, args[property_name])
+        except webthing.errors.PropertyError:
+            self.set_status(400)
+            return
+
+        try:
+            value = await tornado.gen.with_timeout(
+                datetime.timedelta(seconds=self.APPLY_TIMEOUT),
+                prop.value.applied()
+            )
+        except tornado.gen.TimeoutError:
+            # Still ramping towards the value.
+            self.set_status(202)
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({property_name: value}))
+
+
+class PageMixin(object):
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def write_page(self, entries, describe):
+        # Writes the newest entries as a JSON array, oldest first. since and
+        # before filter by creation time in seconds since the epoch, a Link
+        # header points to the next page of older entries.
+        try:
+            limit = int(self.get_argument('limit', self.DEFAULT_LIMIT))
+            since = self.get_argument('since', None)
+            since = float(since) if since is not None else None
+            before = self.get_argument('before', None)
+            before = float(before) if before is not None else None
+        except ValueError:
+            self.set_status(400)
+            return
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        page = []
+        more = False
+        for entry in reversed(entries):
+            created = getattr(entry, 'created', 0)
+            if before is not None and created >= before:
+                continue
+            if since is not None and created <= since:
+                break
+            if len(page) == limit:
+                more = True
+                break
+            page.append(entry)
+        page.reverse()
+
+        if more:
+            self.set_header(
+                'Link',
+                '<' + self.request.path + '?' + urllib.parse.urlencode({
+                    'limit': limit,
+                    'before': repr(page[0].created)
+                }) + '>; rel="next"'
+            )
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps([describe(entry) for entry in page]))
+
+
+class ActionRequestMixin(object):
+    def request_actions(self, thing_id='0', action_name=None):
+        # Like webthing, but rejected actions are answered with 400 instead
+        # of being left out of a 201.
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+        try:
+            message = json.loads(self.request.body.decode())
+            if not isinstance(message, dict):
+                raise ValueError('not an object')
+        except ValueError:
+            self.set_status(400)
+            return
+
+        actions = []
+        for name, params in message.items():
+            if action_name is not None and name != action_name:
+                continue
+            input_ = params.get('input') if isinstance(params, dict) else None
+            action = thing.perform_action(name, input_)
+            if action is None:
+                # Forget the ones that were accepted before.
+                for accepted in actions:
+                    thing.remove_action(
+                        accepted.get_name(),
+                        accepted.get_id()
+                    )
+                self.set_status(400)
+                self.set_header('Content-Type', 'application/json')
+                self.write(json.dumps({'error': 'invalid action: ' + name}))
+                return
+            actions.append(action)
+
+        response = {}
+        for action in actions:
+            response.update(action.as_action_description())
+            tornado.ioloop.IOLoop.current().spawn_callback(
+                webthing.server.perform_action,
+                action
+            )
+        self.set_status(201)
+        self.write(json.dumps(response))
+
+
+class ActionsHandler(
+    PageMixin,
+    ActionRequestMixin,
+    webthing.server.ActionsHandler
+):
+    def post(self, thing_id='0'):
+        self.request_actions(thing_id)
+
+    def get(self, thing_id='0'):
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+        for name in thing.actions:
+            thing.prune_actions(name)
+        entries = [
+            entry for actions in thing.actions.values() for entry in actions
+        ]
+        entries.sort(key=lambda entry: getattr(entry, 'created', 0))
+        self.write_page(entries, lambda entry: entry.as_action_description())
+
+
+class ActionHandler(
+    PageMixin,
+    ActionRequestMixin,
+    webthing.server.ActionHandler
+):
+    def post(self, thing_id='0', action_name=None):
+        self.request_actions(thing_id, action_name)
+
+    def get(self, thing_id='0', action_name=None):
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+        thing.prune_actions(action_name)
+        self.write_page(
+            thing.actions.get(action_name, []),
+            lambda entry: entry.as_action_description()
+        )
+
+
+class EventsHandler(PageMixin, webthing.server.EventsHandler):
+    def get(self, thing_id='0'):
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+        thing.prune_events()
+        self.write_page(
+            thing.events,
+            lambda entry: entry.as_event_description()
+        )
+
+
+class EventHandler(PageMixin, webthing.server.EventHandler):
+    def get(self, thing_id='0', event_name=None):
+        thing = self.get_thing(thing_id)
+        if thing is None:
+            self.set_status(404)
+            return
+        thing.prune_events()
+        self.write_page(
+            [entry for entry in thing.events if entry.name == event_name],
+            lambda entry: entry.as_event_description()
+        )
+
+
+class ConfigHandler(tornado.web.RequestHandler):
+    def initialize(self, core):
+        self.core = core
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(self.core.getConfig()))
+
+    async def put(self):
+        try:
+            config = json.loads(self.request.body.decode())
+        except ValueError:
+            self.set_status(400)
+            return
+        if not isinstance(config, dict):
+            self.set_status(400)
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps({'error': 'expected an object'}))
+            return
+
+        try:
+            await self.core.updateConfig(config)
+        except ValueError as e:
+            self.set_status(400)
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps({'error': str(e)}))
+            return
+
+        self.get()
+
+
+class UpdateBridge(object):
+    def __init__(self, thing):
+        self.thing = thing
+        # Latest value of each property that was not applied yet, so a
+        # stalled loop only gets the last value of every property and
+        # none is lost.
+        self.pending = collections.OrderedDict()
+        self.lock = threading.Lock()
+        # Callbacks finish actions and raise events, so none may be lost.
+        # deque appends and pops are atomic, so producers need no lock.
+        self.calls = collections.deque()
+        self.local = threading.local()
+        self.loop = None
+        self.scheduled = False
+
+    def attach(self, loop):
+        self.loop = loop
+        self.schedule()
+
+    def detach(self):
+        self.loop = None
+        self.scheduled = False
+        with self.lock:
+            self.pending = collections.OrderedDict()
+        self.calls.clear()
+
+    def schedule(self):
+        loop = self.loop
+        if loop is not None and not self.scheduled:
+            self.scheduled = True
+            loop.call_soon_threadsafe(self.drain)
+
+    @contextlib.contextmanager
+    def tick(self):
+        # Hands everything added by this thread over in one piece.
+        self.local.records = []
+        try:
+            yield
+        finally:
+            records = self.local.records
+            self.local.records = None
+            with self.lock:
+                for prop, value in records:
+                    if prop is not None:
+                        self.pending[prop] = value
+            self.calls.extend(
+                record[1] for record in records if record[0] is None
+            )
+            if records:
+                self.schedule()
+
+    def put(self, prop, value):
+        # Can be called from any thread.
+        records = getattr(self.local, 'records', None)
+        if records is not None:
+            records.append((prop, value))
+        else:
+            with self.lock:
+                self.pending[prop] = value
+            self.schedule()
+
+    def discard(self, prop):
+        # Drops the pending value of a property that is removed, so it is
+        # not sent for a new property with the same name.
+        with self.lock:
+            self.pending.pop(prop, None)
+
+    def call(self, callback, *args):
+        # Can be called from any thread. Callbacks of a tick run after its
+        # property values were applied.
+        records = getattr(self.local, 'records', None)
+        if records is not None:
+            records.append((None, lambda: callback(*args)))
+        else:
+            self.calls.append(lambda: callback(*args))
+            self.schedule()
+
+    def drain(self):
+        # Runs on the server loop. Reset the flag first, so records added
+        # while draining schedule another drain.
+        if self.loop is None:
+            return
+        self.scheduled = False
+        with self.lock:
+            pending = self.pending
+            self.pending = collections.OrderedDict()
+        with self.thing.batch():
+            for prop, value in pending.items():
+                prop.value.notify_of_external_update(value)
+        while True:
+            try:
+                callback = self.calls.popleft()
+            except IndexError:
+                break
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+
+class PeriodicTimer(object):
+    def __init__(self, interval, callback):
+        self.interval = interval
+        self.callback = callback
+        self.loop = None
+        self.handle = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.handle = loop.call_later(self.interval, self.run)
+
+    def run(self):
+        try:
+            self.callback()
+        except Exception:
+            traceback.print_exc()
+        self.handle = self.loop.call_later(self.interval, self.run)
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, server, bridge, timers=()):
+        super(ServerThread, self).__init__()
+        self.server = server
+        self.bridge = bridge
+        # PeriodicTimers running on the server loop.
+        self.timers = timers
+        self.event_loop = None
+
+    def run(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.bridge.attach(self.event_loop)
+        for timer in self.timers:
+            timer.start(self.event_loop)
+        self.server.start()
+        tornado.ioloop.IOLoop.current().close(all_fds=True)
+
+    def stop(self):
+        # The server and its loop may only be touched from the loop thread.
+        if self.event_loop is not None:
+            self.event_loop.call_soon_threadsafe(self.shutdown)
+
+    def shutdown(self):
+        for timer in self.timers:
+            timer.stop()
+        self.bridge.detach()
+        self.server.stop()
+        for thing in self.server.things.get_things():
+            for subscriber in list(thing.subscribers):
+                subscriber.close()
+        self.event_loop.stop()
+
+
+class ScheduledValue(webthing.Value):
+    def __init__(self, initial_value, value_forwarder=None):
+        webthing.Value.__init__(self, initial_value, value_forwarder)
+        # Futures of requests waiting for a write to be applied, only used
+        # on the server loop.
+        self.waiters = []
+
+    def set(self, value):
+        # Subscribers are notified by the OutputScheduler once applied.
+        if self.value_forwarder is not None:
+            self.value_forwarder(value)
+
+    def applied(self):
+        future = tornado.concurrent.Future()
+        self.waiters.append(future)
+        return future
+
+    def resolve(self, value):
+        waiters = self.waiters
+        self.waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(value)
+
+
+class OutputScheduler(object):
+    def __init__(self, txt, bridge, slew=None):
+        self.txt = txt
+        self.bridge = bridge
+        # Maximum change per second, None to apply writes directly.
+        self.slew = slew
+        self.lock = threading.Lock()
+        # Last write wins, keyed by property.
+        self.pending = {}
+        self.applied = {}
+        self.last_flush = None
+
+    def set(self, prop, setter, value):
+        with self.lock:
+            self.pending[prop] = (setter, value)
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+        self.applied = {}
+
+    def discard(self, prop):
+        with self.lock:
+            self.pending.pop(prop, None)
+        self.applied.pop(prop, None)
+
+    def flush(self):
+        # Called once per transfer cycle from the acquisition thread.
+        now = time.time()
+        elapsed = now - self.last_flush if self.last_flush else 0
+        self.last_flush = now
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        if not pending:
+            return
+
+        ramping = {}
+        self.txt.SyncDataBegin()
+        try:
+            for prop, (setter, value) in pending.items():
+                target = value
+                current = self.applied.get(prop, prop.value.get())
+                if self.slew is not None and elapsed:
+                    step = max(self.slew * elapsed, 1)
+                    if abs(target - current) > step:
+                        direction = 1 if target > current else -1
+                        value = int(current + step * direction)
+                        ramping[prop] = (setter, target)
+                setter(value)
+                self.applied[prop] = value
+                self.bridge.put(prop, value)
+                if prop not in ramping:
+                    self.bridge.call(prop.value.resolve, value)
+        finally:
+            self.txt.SyncDataEnd()
+
+        if ramping:
+            with self.lock:
+                for prop, entry in ramping.items():
+                    self.pending.setdefault(prop, entry)
+
+
+class Recording(object):
+    def __init__(self, numpy, channels, capacity, duration=None):
+        self.channels = channels
+        self.indices = [
+            (channel[0] == 'C', int(channel[1:]) - 1) for channel in channels
+        ]
+        self.counters = any(counter for counter, index in self.indices)
+        self.buffer = numpy.zeros(
+            capacity,
+            dtype=[('time', '<f8')] + [
+                (channel, '<i4') for channel in channels
+            ]
+        )
+        self.count = 0
+        self.started = time.time()
+        self.until = self.started + duration if duration else None
+        self.truncated = False
+
+    def sample(self, now, inputs, counters):
+        # Returns False once the recording is complete.
+        if self.until is not None and now > self.until:
+            return False
+        if self.count == len(self.buffer):
+            self.truncated = True
+            return False
+        self.buffer[self.count] = (now,) + tuple(
+            counters[index] if counter else inputs[index]
+            for counter, index in self.indices
+        )
+        self.count += 1
+        return True
+
+    def samples(self):
+        return self.buffer[:self.count]
+
+
+class Recorder(object):
+    CHANNELS = [
+        'I1', 'I2', 'I3', 'I4', 'I5', 'I6', 'I7', 'I8',
+        'C1', 'C2', 'C3', 'C4'
+    ]
+
+    def __init__(self, txt, max_bytes=8 * 1024 * 1024, callback=None):
+        self.txt = txt
+        # Size of the preallocated sample buffer of a recording.
+        self.max_bytes = max_bytes
+        # Called with True or False when a recording starts or ends.
+        self.callback = callback
+        self.active = None
+        self.last = None
+
+    def check(self, channels):
+        # Raises ValueError if a recording of channels can not be started.
+        try:
+            import numpy
+        except ImportError:
+            raise ValueError('recording needs numpy')
+        for channel in channels:
+            if channel not in self.CHANNELS:
+                raise ValueError('unknown channel: ' + str(channel))
+
+    def start(self, channels, duration=None):
+        self.check(channels)
+        import numpy
+
+        itemsize = 8 + 4 * len(channels)
+        recording = Recording(
+            numpy,
+            list(channels),
+            self.max_bytes // itemsize,
+            duration
+        )
+        self.last = recording
+        self.active = recording
+        if self.callback:
+            self.callback(True)
+
+    def stop(self):
+        if self.active is None:
+            return
+        self.active = None
+        if self.callback:
+            self.callback(False)
+
+    def sample(self):
+        # Called on every transfer cycle from the acquisition thread.
+        recording = self.active
+        if recording is None:
+            return
+        counters = None
+        if recording.counters:
+            counters = self.txt.getCurrentCounterValue()
+        inputs = self.txt.getCurrentInput()
+        if not recording.sample(time.time(), inputs, counters):
+            if self.active is recording:
+                self.stop()
+
+    def recording(self):
+        # The running or last finished recording.
+        return self.last
+
+
+class RecordingHandler(tornado.web.RequestHandler):
+    CHUNK_SIZE = 65536
+    CSV_ROWS = 1000
+
+    def initialize(self, recorder):
+        self.recorder = recorder
+
+    async def get(self, format):
+        recording = self.recorder.recording()
+        if recording is None:
+            self.set_status(404)
+            return
+        # Later samples of a running recording are not included.
+        samples = recording.samples()
+
+        self.set_header(
+            'Content-Disposition',
+            'attachment; filename="recording.' + format + '"'
+        )
+        if format == 'npy':
+            await self.send_npy(samples)
+        else:
+            await self.send_csv(samples)
+
+    async def send_npy(self, samples):
+        import numpy
+
+        header = io.BytesIO()
+        numpy.lib.format.write_array_header_1_0(
+            header,
+            numpy.lib.format.header_data_from_array_1_0(samples)
+        )
+        header = header.getvalue()
+        body = memoryview(samples.view(numpy.uint8))
+
+        self.set_header('Content-Type', 'application/octet-stream')
+        self.set_header('Content-Length', len(header) + len(body))
+        self.write(header)
+        await self.flush()
+        # Write slices of the buffer directly instead of copying it.
+        for offset in range(0, len(body), self.CHUNK_SIZE):
+            await self.request.connection.write(
+                body[offset:offset + self.CHUNK_SIZE]
+            )
+
+    async def send_csv(self, samples):
+        names = samples.dtype.names
+        self.set_header('Content-Type', 'text/csv')
+        self.write(','.join(names) + '\n')
+        row = '%.6f' + ',%d' * (len(names) - 1) + '\n'
+        for offset in range(0, len(samples), self.CSV_ROWS):
+            self.write(''.join(
+                row % tuple(sample)
+                for sample in samples[offset:offset + self.CSV_ROWS].tolist()
+            ))
+            await self.flush()
+
+
+class ButtonState(object):
+    def __init__(self, level, debounce=0.02, long_press=1, double_click=0.4):
+        # Times are in seconds. A change of the input level is only taken
+        # once it held for debounce.
+        self.debounce = debounce
+        self.long_press = long_press
+        self.double_click = double_click
+        self.level = bool(level)
+        self.presses = 0
+        # First sample of a level change that is not debounced yet.
+        self.changed_at = None
+        self.pressed_at = None
+        # Release of the last short press, which a press can turn into a
+        # double click.
+        self.clicked_at = None
+        self.double = False
+        # A button held at start never raises a long press.
+        self.held = self.level
+        self.pending = False
+
+    def update(self, raw, now):
+        # Returns the events as (kind, time, data) tuples.
+        events = []
+        raw = bool(raw)
+        if raw == self.level:
+            self.changed_at = None
+        else:
+            if self.changed_at is None:
+                self.changed_at = now
+            if now - self.changed_at >= self.debounce:
+                at = self.changed_at
+                self.changed_at = None
+                self.level = raw
+                if raw:
+                    self.press(at, events)
+                else:
+                    self.release(at, events)
+
+        # Not while a release is being debounced, the button may already be
+        # up.
+        if self.level and not self.held and self.changed_at is None and \
+                now - self.pressed_at >= self.long_press:
+            self.held = True
+            events.append(('longPress', now, {
+                'duration': round(now - self.pressed_at, 3)
+            }))
+
+        self.pending = self.changed_at is not None or \
+            (self.level and not self.held)
+        return events
+
+    def press(self, at, events):
+        self.presses += 1
+        self.pressed_at = at
+        self.held = False
+        events.append(('pressed', at, {'count': self.presses}))
+        self.double = self.clicked_at is not None and \
+            at - self.clicked_at <= self.double_click
+        if self.double:
+            self.clicked_at = None
+            events.append(('doubleClick', at, None))
+
+    def release(self, at, events):
+        data = None
+        if self.pressed_at is not None:
+            data = {'duration': round(at - self.pressed_at, 3)}
+        events.append(('released', at, data))
+        if self.held or self.double:
+            self.clicked_at = None
+        else:
+            self.clicked_at = at
+        self.held = True
+
+
+class AnalogFilter(object):
+    def __init__(
+        self,
+        smoothing=None,
+        alpha=0.5,
+        window=5,
+        deadband=0,
+        relative=False,
+        interval=0
+    ):
+        # smoothing is None, 'ema' or 'median'. The deadband is absolute or,
+        # with relative set, a fraction of the last published value.
+        if smoothing not in (None, 'ema', 'median'):
+            raise ValueError('unknown smoothing ' + str(smoothing))
+        for value in (alpha, deadband, interval):
+            if not isinstance(value, (int, float)):
+                raise TypeError('expected a number, got ' + repr(value))
+        if not isinstance(window, int) or window < 1:
+            raise ValueError('window must be a positive integer')
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.samples = collections.deque(maxlen=window)
+        self.deadband = deadband
+        self.relative = relative
+        self.interval = interval
+        self.value = None
+        self.published = None
+        self.published_at = 0
+        # Set while the output has not caught up with the raw input yet, so
+        # the filter keeps being fed even if the raw value stays the same.
+        self.pending = False
+
+    def threshold(self, reference):
+        if self.relative:
+            return self.deadband * abs(reference)
+        return self.deadband
+
+    def smooth(self, raw):
+        if self.smoothing == 'ema':
+            if self.value is None:
+                return raw
+            value = self.value + self.alpha * (raw - self.value)
+            if abs(raw - value) <= max(self.threshold(raw) / 2, 1e-9):
+                return raw
+            return value
+        elif self.smoothing == 'median':
+            self.samples.append(raw)
+            return sorted(self.samples)[(len(self.samples) - 1) // 2]
+        return raw
+
+    def update(self, raw, now):
+        # Returns the value to publish or None if it should be suppressed.
+        self.value = self.smooth(raw)
+        self.pending = self.value != raw
+        if self.published is not None:
+            change = abs(self.value - self.published)
+            if change <= self.threshold(self.published):
+                return None
+            if now - self.published_at < self.interval:
+                self.pending = True
+                return None
+        self.published = self.value
+        self.published_at = now
+        return self.value
+
+
+class ActionExecutor(object):
+    def __init__(self, bridge, poll=0.05):
+        self.bridge = bridge
+        # Seconds between checks whether running actions are done.
+        self.poll = poll
+        self.condition = threading.Condition()
+        # Waiting actions and the running action per resource.
+        self.queues = {}
+        self.active = {}
+        self.cancelled = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stopped(self):
+        # A stopped thread may only notice after a new one was started.
+        return self.thread is not threading.current_thread()
+
+    def stop(self):
+        with self.condition:
+            self.thread = None
+            self.queues = {}
+            self.active = {}
+            self.cancelled = []
+            self.condition.notify_all()
+
+    def submit(self, action):
+        with self.condition:
+            queue = self.queues.setdefault(
+                action.resource(),
+                collections.deque()
+            )
+            queue.append(action)
+            self.condition.notify()
+
+    def cancel(self, action):
+        with self.condition:
+            queue = self.queues.get(action.resource())
+            if queue is not None and action in queue:
+                queue.remove(action)
+            elif self.active.get(action.resource()) is action:
+                self.cancelled.append(action)
+                self.condition.notify()
+
+    def ready(self):
+        return any(
+            queue and resource not in self.active
+            for resource, queue in self.queues.items()
+        )
+
+    def call(self, function, default=None):
+        try:
+            return function()
+        except Exception:
+            traceback.print_exc()
+            return default
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped() and not self.cancelled \
+                        and not self.ready():
+                    if self.active:
+                        self.condition.wait(self.poll)
+                        break
+                    self.condition.wait()
+                if self.stopped():
+                    return
+                cancelled = self.cancelled
+                self.cancelled = []
+                for action in cancelled:
+                    if self.active.get(action.resource()) is action:
+                        del self.active[action.resource()]
+                running = list(self.active.values())
+                starting = []
+                for resource, queue in self.queues.items():
+                    if queue and resource not in self.active:
+                        action = queue.popleft()
+                        self.active[resource] = action
+                        starting.append(action)
+
+            # ftrobopy is called without holding the lock, so submitting
+            # never waits for the TXT.
+            for action in cancelled:
+                self.call(action.stop)
+            for action in running:
+                if self.call(action.done, True):
+                    with self.condition:
+                        if self.active.get(action.resource()) is action:
+                            del self.active[action.resource()]
+                    self.bridge.call(action.finish)
+            for action in starting:
+                action.status = 'pending'
+                self.bridge.call(action.thing.action_notify, action)
+                self.call(action.run)
+
+
+class AcquisitionThread(threading.Thread):
+    def __init__(self, txt, callback, interval=None):
+        super(AcquisitionThread, self).__init__()
+        self.daemon = True
+        self.txt = txt
+        self.callback = callback
+        # None means every ftrobopy transfer cycle, else seconds.
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.interval is None:
+                self.txt.updateWait()
+            else:
+                self.stopped.wait(self.interval)
+            if self.stopped.is_set():
+                break
+            try:
+                self.callback()
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class I2CDevice(metaclass=abc.ABCMeta):
+    ADDRESS = None
+    # Registers written once before the first read.
+    SETUP = []
+    # Start and length of the block that is read in one burst.
+    REGISTER = 0
+    LENGTH = 1
+    # Name suffix and metadata of each value decode returns.
+    VALUES = []
+    CAPABILITY = None
+
+    def __init__(self, name, address=None, rate=1):
+        self.name = name
+        self.address = self.ADDRESS if address is None else address
+        # Seconds between reads.
+        self.interval = 1 / rate
+        self.props = []
+
+    def setup(self, bus):
+        for register, value in self.SETUP:
+            if bus.i2c_write(self.address, register, value) is None:
+                raise IOError('I2C write to ' + hex(self.address) + ' failed')
+
+    def read(self, bus):
+        data = bus.i2c_read(self.address, self.REGISTER, data_len=self.LENGTH)
+        if data is None or len(data) != self.LENGTH:
+            raise IOError('I2C read from ' + hex(self.address) + ' failed')
+        return self.decode(data)
+
+    @abc.abstractmethod
+    def decode(self, data):
+        # Returns the values of VALUES from the raw register bytes.
+        pass
+
+
+class LM75(I2CDevice):
+    ADDRESS = 0x48
+    REGISTER = 0x00
+    LENGTH = 2
+    VALUES = [
+        ('Temperature', {
+            'title': 'Temperature',
+            'type': 'number',
+            'unit': 'degree celsius',
+            '@type': 'TemperatureProperty'
+        })
+    ]
+    CAPABILITY = 'TemperatureSensor'
+
+    def decode(self, data):
+        # 11 bit two's complement in the upper bits, 0.125 °C per step.
+        return [(struct.unpack('>h', data)[0] >> 5) * 0.125]
+
+
+class MPU6050(I2CDevice):
+    ADDRESS = 0x68
+    # Wake up from sleep mode, ranges stay at ±2 g and ±250 °/s.
+    SETUP = [(0x6B, 0x00)]
+    # Acceleration, temperature and rotation.
+    REGISTER = 0x3B
+    LENGTH = 14
+    VALUES = [
+        (axis + 'Acceleration', {
+            'title': 'Acceleration ' + axis,
+            'type': 'number',
+            'unit': 'g'
+        })
+        for axis in 'XYZ'
+    ] + LM75.VALUES + [
+        (axis + 'Rotation', {
+            'title': 'Rotation ' + axis,
+            'type': 'number',
+            'unit': 'degree per second'
+        })
+        for axis in 'XYZ'
+    ]
+
+    def decode(self, data):
+        values = struct.unpack('>7h', data)
+        return [round(value / 16384, 3) for value in values[0:3]] + \
+            [round(values[3] / 340 + 36.53, 1)] + \
+            [round(value / 131, 1) for value in values[4:7]]
+
+
+class BMX055(I2CDevice):
+    # Accelerometer of the fischertechnik combined sensor.
+    ADDRESS = 0x18
+    # ±16 g range and 1000 Hz bandwidth.
+    SETUP = [(0x0F, 0x0C), (0x10, 0x0F)]
+    REGISTER = 0x02
+    LENGTH = 6
+    VALUES = [
+        (axis + 'Acceleration', {
+            'title': 'Acceleration ' + axis,
+            'type': 'number',
+            'unit': 'g'
+        })
+        for axis in 'XYZ'
+    ]
+
+    def decode(self, data):
+        # 12 bit values in the upper bits, 7.81 mg per step.
+        return [
+            round((value >> 4) * 0.00781, 3)
+            for value in struct.unpack('<3h', data)
+        ]
+
+
+class I2CScheduler(threading.Thread):
+    # Seconds until a device is read again after an error.
+    RETRY = 1
+
+    def __init__(self, bus, devices, bridge, metrics=None):
+        super(I2CScheduler, self).__init__()
+        self.daemon = True
+        # All transactions on the bus go through this thread.
+        self.bus = bus
+        self.devices = devices
+        self.bridge = bridge
+        self.metrics = metrics or Metrics()
+        self.readers = [
+            self.metrics.timed(
+                'i2c_read_seconds',
+                device.read,
+                {'device': device.name}
+            )
+            for device in devices
+        ]
+        self.ready = set()
+        self.stopped = threading.Event()
+
+    def run(self):
+        now = time.time()
+        # Index breaks ties between devices due at the same time.
+        queue = [(now, index) for index in range(len(self.devices))]
+        while queue:
+            if self.stopped.wait(max(queue[0][0] - time.time(), 0)):
+                break
+            now = time.time()
+            # Everything due is sent out in one notification.
+            with self.bridge.tick():
+                while queue[0][0] <= now:
+                    due, index = heapq.heappop(queue)
+                    heapq.heappush(queue, (self.poll(index, due, now), index))
+
+    def poll(self, index, due, now):
+        # Returns when the device should be read next.
+        device = self.devices[index]
+        try:
+            if index not in self.ready:
+                device.setup(self.bus)
+                self.ready.add(index)
+            values = self.readers[index](self.bus)
+        except Exception:
+            traceback.print_exc()
+            self.metrics.increment(
+                'i2c_errors_total',
+                1,
+                {'device': device.name}
+            )
+            # The device may have been replugged.
+            self.ready.discard(index)
+            return now + max(device.interval, self.RETRY)
+
+        for prop, value in zip(device.props, values):
+            # Value drops updates that do not change anything.
+            self.bridge.put(prop, value)
+        # Skip reads that were missed instead of catching up.
+        due += device.interval
+        return due if due > now else now + device.interval
+
+    def stop(self):
+        self.stopped.set()
+
+
+def loadEnvJSON(name, kind):
+    # Parses the JSON in the environment variable name, which should be a
+    # dict or list. Reports and ignores it if it is not.
+    value = os.environ.get(name)
+    if value is None:
+        return kind()
+    try:
+        value = json.loads(value)
+        if not isinstance(value, kind):
+            raise ValueError(
+                'not an object' if kind is dict else 'not a list'
+            )
+    except ValueError as e:
+        print('Ignoring ' + name + ': ' + str(e), file=sys.stderr)
+        return kind()
+    return value
+
+
+class wotServer(object):
+    SENSOR_TYPES = [
+        'pushbutton',
+        'resistor',
+        'ultrasonic',
+        'voltage',
+        'linesens',
+        'colorsens'
+    ]
+    ACTOR_TYPES = [
+        'motor',
+        'light'
+    ]
+    I2C_TYPES = {
+        'lm75': LM75,
+        'mpu6050': MPU6050,
+        'bmx055': BMX055
+    }
+    COLOR_MAP = {
+        'rot': '#ff0000',
+        'blau': '#0000ff',
+        'weiss': '#ffffff'
+    }
+    # AnalogFilter arguments per sensor type or state property, can be
+    # overridden with a JSON object in WOT_FILTERS.
+    FILTERS = {
+        'resistor': {
+            'smoothing': 'ema',
+            'alpha': 0.3,
+            'deadband': 0.01,
+            'relative': True,
+            'interval': 0.2
+        },
+        'ultrasonic': {
+            'smoothing': 'median',
+            'window': 5,
+            'deadband': 0.01,
+            'interval': 0.1
+        },
+        'voltage': {
+            'smoothing': 'ema',
+            'alpha': 0.3,
+            'deadband': 0.01,
+            'interval': 0.2
+        },
+        'inputVoltage': {
+            'smoothing': 'ema',
+            'alpha': 0.3,
+            'deadband': 0.05,
+            'interval': 1
+        },
+        'refVoltage': {
+            'smoothing': 'ema',
+            'alpha': 0.3,
+            'deadband': 0.05,
+            'interval': 1
+        },
+        'temperature': {
+            'smoothing': 'ema',
+            'alpha': 0.3,
+            'deadband': 0.5,
+            'interval': 5
+        }
+    }
+
+    def __init__(self, txt, configPath=None):
+        self.txt = txt
+        # File the port types are saved to, None to not persist them.
+        self.configPath = configPath
+
+        self.outputs = [
+            self.txt.C_OUTPUT,
+            self.txt.C_OUTPUT,
+            self.txt.C_OUTPUT,
+            self.txt.C_OUTPUT
         ]
         self.inputs = [
             (self.txt.C_SWITCH, self.txt.C_DIGITAL),
@@ -203,150 +3008,212 @@ class wotApplication(TouchApplication):
             'pushbutton',
             'pushbutton'
         ]
+        self.actors = [
+            'motor',
+            'motor',
+            'motor',
+            'motor'
+        ]
+        self.actor_props = [[], [], [], []]
+        self.motors = [None, None, None, None]
+        # Target distance, action and counter command id before the reset
+        # of running moveDistance actions.
+        self.movements = [None, None, None, None]
+        self.last_counters = None
+        # Inputs whose new reader is being created.
+        self.reconfiguring = set()
+        self.config_lock = tornado.locks.Lock()
+        # Held by the acquisition thread while it reads the port tables and
+        # movements.
+        self.lock = threading.RLock()
+
+        self.cams = []
+        self.streams = {}
+        self.proxy_cache = ProxyCache()
+        self.proxy_upstream = UpstreamPool('localhost')
+        self.server = None
+        self.thread = None
+        self.last_inputs = None
+        self.acquisition = None
+        self.i2c = None
+        self.i2c_devices = []
+        self.input_table = []
+        self.state_table = []
+
+        interval = os.environ.get('WOT_UPDATE_INTERVAL')
+        if interval is None:
+            self.update_interval = None
+        else:
+            self.update_interval = int(interval) / 1000
+
+        slew = os.environ.get('WOT_OUTPUT_SLEW')
+        self.output_slew = float(slew) if slew is not None else None
+
+        self.camera_idle_timeout = float(
+            os.environ.get('WOT_CAMERA_IDLE_TIMEOUT', 10)
+        )
+        self.camera_threshold = float(
+            os.environ.get('WOT_CAMERA_THRESHOLD', 0.005)
+        )
+
+        self.filters = dict(self.FILTERS)
+        for key, options in loadEnvJSON('WOT_FILTERS', dict).items():
+            # A bad entry keeps the default filter of its key.
+            try:
+                if options is not None:
+                    if not isinstance(options, dict):
+                        raise ValueError('not an object')
+                    AnalogFilter(**options)
+            except (TypeError, ValueError) as e:
+                print(
+                    'Ignoring filter ' + key + ': ' + str(e),
+                    file=sys.stderr
+                )
+                continue
+            self.filters[key] = options
+        self.button_config = {}
+        for key, value in loadEnvJSON('WOT_BUTTONS', dict).items():
+            # A bad entry keeps the default of its timing.
+            try:
+                if key not in ('debounce', 'long_press', 'double_click'):
+                    raise ValueError('unknown timing')
+                if not isinstance(value, (int, float)) or value < 0:
+                    raise ValueError('not a number of seconds')
+            except ValueError as e:
+                print(
+                    'Ignoring button timing ' + key + ': ' + str(e),
+                    file=sys.stderr
+                )
+                continue
+            self.button_config[key] = value
+
+        self.thing = TXTThing(
+            self.txt.getDevicename(),
+            ['MultiLevelSwitch'],
+            'fischertechnik TXT ' + str(self.txt.getVersionNumber()),
+            int(os.environ.get('WOT_HISTORY_SIZE', 3600)),
+            int(os.environ.get('WOT_MAX_EVENTS', 1000)),
+            int(os.environ.get('WOT_MAX_ACTIONS', 100)),
+            float(os.environ.get('WOT_MAX_AGE', 86400))
+        )
+        self.thing.set_ui_href('/cfw/')
+        self.bridge = UpdateBridge(self.thing)
+        self.outputScheduler = OutputScheduler(
+            self.txt,
+            self.bridge,
+            self.output_slew
+        )
+        self.thing.txt = self.txt
+        self.thing.core = self
+        self.executor = ActionExecutor(self.bridge)
+        self.thing.executor = self.executor
+        self.metrics = Metrics(os.environ.get('WOT_METRICS') == '1')
+        self.thing.metrics = self.metrics
+        self.metrics.gauge(
+            'websocket_subscribers',
+            lambda: len(self.thing.subscribers)
+        )
+        self.recorder = Recorder(
+            self.txt,
+            int(os.environ.get('WOT_RECORDING_SIZE', 8 * 1024 * 1024)),
+            lambda recording: self.set_property('recording', recording)
+        )
+        self.thing.recorder = self.recorder
+        self.stateTimer = PeriodicTimer(1, self.update_state)
+        for i in range(0, 4):
+            self.addCounter(i)
+        self.addResetCounters()
+        self.addMoveDistance()
 
-        self.inputButtons = []
-        self.outputButtons = []
-        self.cams = []
-        self.caps = {}
-        self.last_update = None
-        self.temp_dir = None
-
-        if not self.txt:
-            err_msg = QLabel('Error connectiong to IO server')
-            err_msg.setWordWrap(True)
-            err_msg.setAlignment(Qt.AlignCenter)
-            self.w.setCentralWidget(err_msg)
-        else:
-            self.thing = webthing.Thing(
-                self.txt.getDevicename(),
-                ['MultiLevelSwitch'],
-                'fischertechnik TXT ' + str(self.txt.getVersionNumber())
-            )
-            self.thing.set_ui_href('/cfw/')
-            self.server = None
-            self.thing.txt = self.txt
-            self.timer = QTimer(self)
-            self.timer.timeout.connect(self.update_level)
-            for i in range(0, 4):
-                self.addCounter(i)
-            self.addResetCounters()
-
-            self.addPlaySound()
-            self.addStateProps()
-
-            givenCam = os.environ.get('FTC_CAM')
-            cam = None
-            if givenCam is None:
-                cam = 0
-            else:
-                cam = int(givenCam)
-
-            camPath = Path('/dev/video' + str(cam))
-            if camPath.exists():
-                self.addCamera(cam)
-
-            main_page = self.buildMainPage()
-            input_page = self.buildInputPage()
-            output_page = self.buildOutputPage()
-
-            tabBar = QTabWidget()
-            tabBar.addTab(main_page, 'Start')
-            tabBar.addTab(input_page, 'Inputs')
-            tabBar.addTab(output_page, 'Outputs')
-            self.w.setCentralWidget(tabBar)
-            self.tabs = tabBar
-
-        self.w.show()
-        self.exec_()
-
-    def buildMainPage(self):
-        page = QWidget()
-        vbox = QVBoxLayout()
-        button = QPushButton('start')
-        button.clicked.connect(self.start)
-        vbox.addWidget(button)
-        page.setLayout(vbox)
-        return page
-
-    def buildInputPage(self):
-        page = QWidget()
-        vbox = QVBoxLayout()
-        for input in range(1, 9):
-            hbox = QHBoxLayout()
-            title = QLabel('I' + str(input))
-            hbox.addWidget(title)
-            type = QPushButton('pushbutton')
-            type.clicked.connect(self.toggleInputType)
-            hbox.addWidget(type)
-            vbox.addLayout(hbox)
-            self.inputButtons.append(type)
-        page.setLayout(vbox)
-        return page
-
-    def buildOutputPage(self):
-        page = QWidget()
-        vbox = QVBoxLayout()
-        for output in range(1, 5):
-            hbox = QHBoxLayout()
-            title = QLabel('M' + str(output))
-            hbox.addWidget(title)
-            type = QPushButton('motor')
-            type.clicked.connect(self.toggleOutputType)
-            hbox.addWidget(type)
-            vbox.addLayout(hbox)
-            self.outputButtons.append(type)
-        page.setLayout(vbox)
-        return page
-
-    def toggleInputType(self):
-        rec = self.sender()
-        if rec.text() == 'pushbutton':
-            rec.setText('resistor')
-        elif rec.text() == 'resistor':
-            rec.setText('ultrasonic')
-        elif rec.text() == 'ultrasonic':
-            rec.setText('voltage')
-        elif rec.text() == 'voltage':
-            rec.setText('linesens')
-        elif rec.text() == 'linesens':
-            rec.setText('colorsens')
-        else:
-            rec.setText('pushbutton')
+        self.addPlaySound()
+        self.addRecording()
+        self.addStateProps()
+        self.thing.add_available_event('configurationChanged', {
+            'title': 'Configuration changed',
+            'description': 'The type of an input or output was changed',
+            'type': 'object'
+        })
 
-    def toggleOutputType(self):
-        rec = self.sender()
-        if rec.text() == 'motor':
-            rec.setText('light')
+        givenCam = os.environ.get('FTC_CAM')
+        cam = None
+        if givenCam is None:
+            cam = 0
         else:
-            rec.setText('motor')
+            cam = int(givenCam)
+
+        camPath = Path('/dev/video' + str(cam))
+        if camPath.exists():
+            self.addCamera(cam)
+
+        for spec in loadEnvJSON('WOT_I2C', list):
+            # A bad entry should not keep the other sensors from working.
+            try:
+                self.addI2CDevice(spec)
+            except ValueError as e:
+                print(
+                    'Ignoring I2C device ' + json.dumps(spec) + ': ' + str(e),
+                    file=sys.stderr
+                )
 
-    def getSensorValue(self, index, type):
+    def getSensorReader(self, index, type):
+        # Wrappers reconfigure the input and wait for a transfer cycle when
+        # created, so only create them once per configuration.
+        num = index + 1
         if type == 'pushbutton':
-            rawValue = self.txt.input(index + 1).state() == 1
+            state = self.txt.input(num).state
+            return lambda: state() == 1
         elif type == 'resistor':
-            try:
-                rawValue = self.txt.resistor(index + 1).value()
-            except:
-                rawValue = self.txt.resistor(index + 1).resistance()
+            sensor = self.txt.resistor(num)
+            if hasattr(sensor, 'value'):
+                return sensor.value
+            return sensor.resistance
         elif type == 'ultrasonic':
-            rawValue = self.txt.ultrasonic(index + 1).distance() / 100
+            distance = self.txt.ultrasonic(num).distance
+            return lambda: distance() / 100
         elif type == 'voltage':
-            rawValue = self.txt.voltage(index + 1).voltage() / 1000
+            voltage = self.txt.voltage(num).voltage
+            return lambda: voltage() / 1000
         elif type == 'linesens':
-            rawValue = self.txt.trailfollower(index + 1).state()
+            return self.txt.trailfollower(num).state
         elif type == 'colorsens':
-            color = self.txt.colorsensor(index + 1).color()
-            if color not in self.COLOR_MAP:
-                rawValue = color
-            else:
-                rawValue = self.COLOR_MAP[color]
-        return rawValue
+            color = self.txt.colorsensor(num).color
+            color_map = self.COLOR_MAP
+
+            def readColor():
+                rawColor = color()
+                return color_map.get(rawColor, rawColor)
+            return readColor
+
+    def getFilter(self, key):
+        if key not in self.filters or self.filters[key] is None:
+            return None
+        return AnalogFilter(**self.filters[key])
+
+    def addButtonEvents(self, name):
+        self.thing.add_available_event('pressedEvent' + name, {
+            '@type': 'PressedEvent',
+            'title': name + ' pressed',
+            'type': 'object'
+        })
+        self.thing.add_available_event('releasedEvent' + name, {
+            'title': name + ' released',
+            'type': 'object'
+        })
+        self.thing.add_available_event('longPressEvent' + name, {
+            '@type': 'LongPressedEvent',
+            'title': name + ' long pressed',
+            'type': 'object'
+        })
+        self.thing.add_available_event('doubleClickEvent' + name, {
+            '@type': 'DoublePressedEvent',
+            'title': name + ' double clicked'
+        })
 
     def addCapability(self, capability):
-        if capability not in self.thing.type:
-            self.thing.type.append(capability)
+        self.thing.add_type(capability)
 
-    def addSensor(self, index, type):
+    def addSensor(self, index, type, read=None):
+        # read is the reader from getSensorReader, created here if None.
         unit = None
         semanticType = None
         name = 'I' + str(index + 1)
@@ -356,10 +3223,7 @@ class wotApplication(TouchApplication):
             semanticType = 'PushedProperty'
             self.addCapability('PushButton')
             self.inputs[index] = (self.txt.C_SWITCH, self.txt.C_DIGITAL)
-            self.thing.add_available_event('pressedEvent' + name, {
-                '@type': 'PressedEvent',
-                'title': name + ' pressed'
-            })
+            self.addButtonEvents(name)
         elif type == 'resistor':
             rawType = 'number'
             unit = 'Ohm'
@@ -385,72 +3249,150 @@ class wotApplication(TouchApplication):
             self.addCapability('ColorControl')
 
         self.sensors[index] = type
-        value = webthing.Value(self.getSensorValue(index, type))
-
-        self.thing.add_property(
-            webthing.Property(
-                self.thing,
-                name,
-                value,
-                metadata={
-                    'title': name,
-                    'type': rawType,
-                    'readOnly': True,
-                    'unit': unit,
-                    '@type': semanticType
-                }
-            )
+        if read is None:
+            read = self.getSensorReader(index, type)
+        reader = self.metrics.timed(
+            'ftrobopy_read_seconds',
+            read,
+            {'type': type}
+        )
+        value = reader()
+        button = None
+        if type == 'pushbutton':
+            button = ButtonState(value, **self.button_config)
+        prop = webthing.Property(
+            self.thing,
+            name,
+            webthing.Value(value),
+            metadata={
+                'title': name,
+                'type': rawType,
+                'readOnly': True,
+                'unit': unit,
+                '@type': semanticType
+            }
+        )
+        self.thing.add_property(prop)
+        return (
+            index,
+            name,
+            prop,
+            reader,
+            button,
+            self.getFilter(type)
         )
 
-    def addActor(self, index, type):
+    def getActorWrappers(self, index, type):
+        # Like sensor readers, creating these waits for a transfer cycle.
         if type == 'motor':
-            self.outputs[index] = self.txt.C_MOTOR
-            plug = 'M' + str(index + 1)
-            self.thing.add_property(
-                webthing.Property(
-                    self.thing,
-                    plug,
-                    webthing.Value(
-                        0,
-                        lambda new_value: self.update_output(index, new_value)
-                    ),
-                    metadata={
-                        '@type': 'LevelProperty',
-                        'title': plug,
-                        'type': 'integer',
-                        'minimum': -512,
-                        'maximum': 512
-                    }
-                )
-            )
+            return [self.txt.motor(index + 1)]
         elif type == 'light':
-            self.outputs[index] = self.txt.C_OUTPUT
-            for offset in range(1, 3):
-                self.addLight(index, offset)
+            return [
+                self.txt.output((index * 2) + offset)
+                for offset in range(1, 3)
+            ]
 
-    def addLight(self, index, offset):
-        plug = 'O' + str((index * 2) + offset)
-        self.thing.add_property(
-            webthing.Property(
+    def addActor(self, index, type, wrappers=None):
+        if wrappers is None:
+            wrappers = self.getActorWrappers(index, type)
+        if type == 'motor':
+            self.outputs[index] = self.txt.C_MOTOR
+            plug = 'M' + str(index + 1)
+            motor = wrappers[0]
+            setSpeed = motor.setSpeed
+            self.motors[index] = motor
+            prop = webthing.Property(
                 self.thing,
                 plug,
-                webthing.Value(
-                    1,
-                    lambda new_value: self.update_output(
-                        index,
-                        new_value,
-                        offset
+                ScheduledValue(
+                    0,
+                    lambda new_value: self.outputScheduler.set(
+                        prop,
+                        setSpeed,
+                        new_value
                     )
                 ),
                 metadata={
                     '@type': 'LevelProperty',
                     'title': plug,
                     'type': 'integer',
-                    'minimum': 1,
+                    'minimum': -512,
                     'maximum': 512
                 }
             )
+            self.thing.add_property(prop)
+            props = [
+                prop,
+                self.addMotorDistance(plug + 'distance', 'Distance'),
+                self.addMotorDistance(plug + 'remaining', 'Remaining')
+            ]
+        elif type == 'light':
+            self.outputs[index] = self.txt.C_OUTPUT
+            props = [
+                self.addLight(index, offset, output)
+                for offset, output in zip(range(1, 3), wrappers)
+            ]
+        self.actors[index] = type
+        self.actor_props[index] = props
+        return props
+
+    def addMotorDistance(self, name, title):
+        prop = webthing.Property(
+            self.thing,
+            name,
+            webthing.Value(0),
+            metadata={
+                'title': title,
+                'type': 'integer',
+                'minimum': 0,
+                'readOnly': True
+            }
+        )
+        self.thing.add_property(prop)
+        return prop
+
+    def addLight(self, index, offset, output):
+        plug = 'O' + str((index * 2) + offset)
+        setLevel = output.setLevel
+        prop = webthing.Property(
+            self.thing,
+            plug,
+            ScheduledValue(
+                1,
+                lambda new_value: self.outputScheduler.set(
+                    prop,
+                    setLevel,
+                    new_value
+                )
+            ),
+            metadata={
+                '@type': 'LevelProperty',
+                'title': plug,
+                'type': 'integer',
+                'minimum': 1,
+                'maximum': 512
+            }
         )
+        self.thing.add_property(prop)
+        return prop
+
+    def removeSensor(self, index):
+        name = self.input_table[index][1]
+        self.thing.remove_property(self.input_table[index][2])
+        self.bridge.discard(self.input_table[index][2])
+        for kind in ('pressed', 'released', 'longPress', 'doubleClick'):
+            self.thing.remove_available_event(kind + 'Event' + name)
+
+    def removeActor(self, index):
+        movement = self.movements[index]
+        if movement is not None:
+            self.stopMovement(movement[1])
+        for prop in self.actor_props[index]:
+            self.thing.remove_property(prop)
+            self.outputScheduler.discard(prop)
+            self.bridge.discard(prop)
+        self.actor_props[index] = []
+        self.motors[index] = None
 
     def addCounter(self, index):
         self.thing.add_property(
@@ -480,6 +3422,40 @@ class wotApplication(TouchApplication):
             ResetCounterAction
         )
 
+    def addMoveDistance(self):
+        self.thing.add_available_action(
+            'moveDistance',
+            {
+                'title': 'Move distance',
+                'description': 'Run an encoder motor for a number of ' +
+                'counter steps',
+                'input': {
+                    'type': 'object',
+                    'required': [
+                        'motor',
+                        'distance'
+                    ],
+                    'properties': {
+                        'motor': {
+                            'type': 'string',
+                            'enum': ['M1', 'M2', 'M3', 'M4']
+                        },
+                        'distance': {
+                            'type': 'integer',
+                            'minimum': 1
+                        },
+                        'speed': {
+                            'type': 'integer',
+                            'default': 512,
+                            'minimum': -512,
+                            'maximum': 512
+                        }
+                    }
+                }
+            },
+            MoveDistanceAction
+        )
+
     def addPlaySound(self):
         self.thing.add_available_action(
             'playSound',
@@ -501,6 +3477,12 @@ class wotApplication(TouchApplication):
                             'default': 100,
                             'minimum': 0,
                             'maximum': 100
+                        },
+                        'repeat': {
+                            'type': 'integer',
+                            'default': 1,
+                            'minimum': 1,
+                            'maximum': 255
                         }
                     }
                 }
@@ -508,57 +3490,125 @@ class wotApplication(TouchApplication):
             SoundAction
         )
 
-    def addStateProps(self):
+    def addRecording(self):
         self.thing.add_property(
             webthing.Property(
                 self.thing,
-                'inputVoltage',
-                webthing.Value(self.txt.getPower() / 1000),
+                'recording',
+                webthing.Value(False),
                 metadata={
-                    '@type': 'VoltageProperty',
-                    'type': 'number',
+                    '@type': 'BooleanProperty',
+                    'title': 'Recording',
+                    'type': 'boolean',
                     'readOnly': True,
-                    'unit': 'volt',
-                    'title': 'Input voltage'
+                    'links': [
+                        {
+                            'rel': 'alternate',
+                            'href': '/recording.npy',
+                            'mediaType': 'application/octet-stream'
+                        },
+                        {
+                            'rel': 'alternate',
+                            'href': '/recording.csv',
+                            'mediaType': 'text/csv'
+                        }
+                    ]
                 }
             )
         )
-        self.thing.add_property(
-            webthing.Property(
-                self.thing,
-                'refVoltage',
-                webthing.Value(self.txt.getReferencePower() / 1000),
-                metadata={
-                    '@type': 'VoltageProperty',
-                    'type': 'number',
-                    'readOnly': True,
-                    'unit': 'volt',
-                    'title': 'Reference voltage'
+        self.thing.add_available_action(
+            'startRecording',
+            {
+                'title': 'Start recording',
+                'description': 'Record raw inputs and counters on every ' +
+                'transfer cycle',
+                'input': {
+                    'type': 'object',
+                    'properties': {
+                        'channels': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'string',
+                                'enum': Recorder.CHANNELS
+                            }
+                        },
+                        'duration': {
+                            'type': 'number',
+                            'minimum': 0,
+                            'unit': 'second',
+                            'description': 'Stop after this many seconds, ' +
+                            '0 records until stopped'
+                        }
+                    }
                 }
-            )
+            },
+            StartRecordingAction
         )
-        self.thing.add_property(
-            webthing.Property(
-                self.thing,
-                'temperature',
-                webthing.Value(self.txt.getTemperature()),
-                metadata={
-                    # '@type': 'TemperatureProperty',
-                    'type': 'number',
-                    'readOnly': True,
-                    'title': 'Temperature'
-                    # 'unit': 'degrees celsius'
-                }
-            )
+        self.thing.add_available_action(
+            'stopRecording',
+            {
+                'title': 'Stop recording'
+            },
+            StopRecordingAction
+        )
+
+    def addStateProp(self, name, reader, metadata):
+        reader = self.metrics.timed(
+            'ftrobopy_read_seconds',
+            reader,
+            {'type': name}
+        )
+        prop = webthing.Property(
+            self.thing,
+            name,
+            webthing.Value(reader()),
+            metadata=metadata
+        )
+        self.thing.add_property(prop)
+        self.state_table.append((name, prop, reader, self.getFilter(name)))
+
+    def addStateProps(self):
+        txt = self.txt
+        self.addStateProp(
+            'inputVoltage',
+            lambda: txt.getPower() / 1000,
+            {
+                '@type': 'VoltageProperty',
+                'type': 'number',
+                'readOnly': True,
+                'unit': 'volt',
+                'title': 'Input voltage'
+            }
+        )
+        self.addStateProp(
+            'refVoltage',
+            lambda: txt.getReferencePower() / 1000,
+            {
+                '@type': 'VoltageProperty',
+                'type': 'number',
+                'readOnly': True,
+                'unit': 'volt',
+                'title': 'Reference voltage'
+            }
+        )
+        self.addStateProp(
+            'temperature',
+            txt.getTemperature,
+            {
+                # '@type': 'TemperatureProperty',
+                'type': 'number',
+                'readOnly': True,
+                'title': 'Temperature'
+                # 'unit': 'degrees celsius'
+            }
         )
 
     def addCamera(self, cam):
-        if self.temp_dir is None:
-            self.temp_dir = TemporaryDirectory()
+        name = 'camera' + str(cam)
         self.thing.add_property(
             webthing.Property(
                 self.thing,
-                'camera' + str(cam),
+                name,
                 webthing.Value(None),
                 metadata={
                     'title': 'Camera',
@@ -569,6 +3619,18 @@ class wotApplication(TouchApplication):
                             'rel': 'alternate',
                             'href': '/static/camera' + str(cam) + '.jpg',
                             'mediaType': 'image/jpeg'
+                        },
+                        {
+                            'rel': 'alternate',
+                            'href': '/static/camera' + str(cam) +
+                            '_thumb.jpg',
+                            'mediaType': 'image/jpeg',
+                            'title': 'Thumbnail'
+                        },
+                        {
+                            'rel': 'alternate',
+                            'href': '/stream/camera' + str(cam) + '.mjpg',
+                            'mediaType': 'multipart/x-mixed-replace'
                         }
                     ]
                 }
@@ -576,113 +3638,409 @@ class wotApplication(TouchApplication):
         )
         self.addCapability('Camera')
         self.cams.append(cam)
+        stream = CameraStream(
+            cam,
+            self.camera_idle_timeout,
+            metrics=self.metrics,
+            threshold=self.camera_threshold,
+            callback=lambda sequence: self.set_property(name, sequence)
+        )
+        self.streams[cam] = stream
+        self.metrics.gauge(
+            'camera_fps',
+            lambda: stream.fps if stream.capture is not None else 0,
+            stream.labels
+        )
 
-    def startCams(self):
-        for cam in self.cams:
-            self.caps[cam] = cv2.VideoCapture(cam)
-            # self.writer = cv2.VideoWriter(
-            #     os.path.join(self.temp_dir.name, 'video' + str(self.cam) + '.avi'),
-            #     cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'),
-            #     10,
-            #     (320, 240)
-            # )
-            if self.caps[cam].isOpened():
-                self.caps[cam].set(3, 320)
-                self.caps[cam].set(4, 240)
-                self.caps[cam].set(5, 10)
+    def addI2CDevice(self, spec):
+        # spec is like {"type": "lm75", "name": "room", "rate": 2}, the
+        # properties are named after the device name, the type by default.
+        if not isinstance(spec, dict):
+            raise ValueError('not an object')
+        unknown = set(spec) - {'type', 'name', 'address', 'rate'}
+        if unknown:
+            raise ValueError('unknown keys ' + ', '.join(sorted(unknown)))
+        type = spec.get('type')
+        if type not in self.I2C_TYPES:
+            raise ValueError('unknown I2C device type: ' + str(type))
+        name = spec.get('name', type)
+        if not isinstance(name, str) or not name:
+            raise ValueError('name must be a non-empty string')
+        address = spec.get('address')
+        if address is not None and (
+            not isinstance(address, int) or not 0 <= address < 128
+        ):
+            raise ValueError('address must be a 7 bit integer')
+        rate = spec.get('rate', 1)
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError('rate must be a positive number')
+        if any(
+            self.thing.has_property(name + suffix)
+            for suffix, metadata in self.I2C_TYPES[type].VALUES
+        ):
+            raise ValueError('name ' + name + ' is already used')
+        device = self.I2C_TYPES[type](name, address, rate)
+        for suffix, metadata in device.VALUES:
+            metadata = dict(metadata)
+            metadata['title'] = device.name + ' ' + metadata['title']
+            metadata['readOnly'] = True
+            prop = webthing.Property(
+                self.thing,
+                device.name + suffix,
+                webthing.Value(None),
+                metadata=metadata
+            )
+            self.thing.add_property(prop)
+            device.props.append(prop)
+        if device.CAPABILITY is not None:
+            self.addCapability(device.CAPABILITY)
+        self.i2c_devices.append(device)
 
     def stopCams(self):
+        # Cameras start capturing on demand and stop when idle.
         for cam in self.cams:
-            if self.caps[cam] is not None:
-                self.caps[cam].release()
-                # self.writer.release()
-            # self.writer = None
-            self.caps[cam] = None
-        self.last_update = None
+            self.streams[cam].stop()
 
-    def capCams(self):
-        if self.last_update is not None and self.last_update + 0.1 > time.time():
+    def start(self, sensors, actors):
+        if self.server is not None:
             return
-        self.last_update = time.time()
-        for cam in self.cams:
-            frame = self.caps[cam].read()[1]
-            # self.writer.write(frame)
-            cv2.imwrite(
-                os.path.join(self.temp_dir.name, 'camera' + str(cam) + '.jpg'),
-                frame
+
+        self.txt.setConfig(self.outputs, self.inputs)
+        self.txt.updateConfig()
+
+        # Drop the ports of the last run, their types may have changed.
+        for index in range(len(self.input_table)):
+            self.removeSensor(index)
+        for index in range(len(self.actor_props)):
+            self.removeActor(index)
+
+        self.input_table = [
+            self.addSensor(index, type)
+            for index, type in enumerate(sensors)
+        ]
+
+        for index, type in enumerate(actors):
+            self.addActor(index, type)
+        self.saveConfig()
+
+        things = webthing.SingleThing(self.thing)
+        # Replacements for webthing handlers, the hosts they accept are only
+        # known once the server exists.
+        hosts = []
+        thingArgs = {
+            'things': things,
+            'hosts': hosts
+        }
+        self.server = webthing.WebThingServer(
+            things,
+            port=8888,
+            additional_routes=[
+                (
+                    r'/?',
+                    ThingHandler,
+                    thingArgs
+                ),
+                (
+                    r'/properties/?',
+                    PropertiesHandler,
+                    thingArgs
+                ),
+                (
+                    r'/properties/(?P<property_name>[^/]+)/?',
+                    PropertyHandler,
+                    thingArgs
+                ),
+                (
+                    r'/actions/?',
+                    ActionsHandler,
+                    thingArgs
+                ),
+                (
+                    r'/actions/(?P<action_name>[^/]+)/?',
+                    ActionHandler,
+                    thingArgs
+                ),
+                (
+                    r'/events/?',
+                    EventsHandler,
+                    thingArgs
+                ),
+                (
+                    r'/events/(?P<event_name>[^/]+)/?',
+                    EventHandler,
+                    thingArgs
+                ),
+                (
+                    r'/static/camera(\d+)(_thumb)?\.jpg',
+                    CameraFrameHandler,
+                    {
+                        'streams': self.streams
+                    }
+                ),
+                (
+                    r'/stream/camera(\d+)\.mjpg',
+                    MJPEGHandler,
+                    {
+                        'streams': self.streams
+                    }
+                ),
+                (
+                    r'/properties/([^/]+)/history',
+                    PropertyHistoryHandler,
+                    {
+                        'thing': self.thing
+                    }
+                ),
+                (
+                    r'/recording\.(npy|csv)',
+                    RecordingHandler,
+                    {
+                        'recorder': self.recorder
+                    }
+                ),
+                (
+                    r'/metrics(\.json)?',
+                    MetricsHandler,
+                    {
+                        'metrics': self.metrics
+                    }
+                ),
+                (
+                    r'/config',
+                    ConfigHandler,
+                    {
+                        'core': self
+                    }
+                ),
+                (
+                    r'/cfw/(.*)',
+                    ReverseProxyHandler,
+                    {
+                        'upstream': self.proxy_upstream,
+                        'cache': self.proxy_cache,
+                        'metrics': self.metrics
+                    }
+                )
+            ]
+        )
+        hosts.extend(self.server.hosts)
+        self.thread = ServerThread(
+            self.server,
+            self.bridge,
+            [self.stateTimer]
+        )
+
+        self.last_inputs = None
+        self.acquisition = AcquisitionThread(
+            self.txt,
+            self.metrics.timed('update_seconds', self.update_level),
+            self.update_interval
+        )
+        self.acquisition.start()
+        self.executor.start()
+        if self.i2c_devices:
+            self.i2c = I2CScheduler(
+                self.txt,
+                self.i2c_devices,
+                self.bridge,
+                self.metrics
             )
+            self.i2c.start()
 
-    def start(self):
-        rec = self.sender()
-        rec.setDisabled(True)
+        try:
+            self.thread.start()
+        except Exception:
+            self.acquisition.stop()
+            self.acquisition = None
+            self.executor.stop()
+            self.stopI2C()
+            self.stopCams()
+            self.server = None
+            self.thread = None
+            raise
+
+    def stop(self):
         if self.server is None:
-            self.txt.setConfig(self.outputs, self.inputs)
-            self.txt.updateConfig()
-
-            # TODO remove all existing stuff on the thing
-
-            for index, inputButton in enumerate(self.inputButtons):
-                self.addSensor(index, inputButton.text())
-
-            for index, outputButton in enumerate(self.outputButtons):
-                self.addActor(index, outputButton.text())
-
-            if self.server is None:
-                self.server = webthing.WebThingServer(
-                    webthing.SingleThing(self.thing),
-                    port=8888,
-                    additional_routes=[
-                        (
-                            r'/static/(.*)',
-                            tornado.web.StaticFileHandler,
-                            {
-                                'path': self.temp_dir.name
-                            }
-                        ),
-                        (
-                            r'/cfw/(.*)',
-                            ReverseProxyHandler,
-                            {
-                                'host': 'localhost'
-                            }
-                        )
-                    ]
+            return
+        self.thread.stop()
+        # Wait for the port to be released so the server can restart.
+        self.thread.join(5)
+        self.thread = None
+        self.server = None
+        self.acquisition.stop()
+        self.acquisition = None
+        self.outputScheduler.clear()
+        self.movements = [None, None, None, None]
+        self.executor.stop()
+        self.recorder.stop()
+        self.stopI2C()
+        self.stopCams()
+
+    def stopI2C(self):
+        if self.i2c is not None:
+            self.i2c.stop()
+            # Keep a restarted scheduler from sharing the bus with this one.
+            self.i2c.join(1)
+            self.i2c = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def getConfig(self):
+        return {
+            'inputs': list(self.sensors),
+            'outputs': list(self.actors)
+        }
+
+    def saveConfig(self):
+        if self.configPath is None:
+            return
+        # Replace the file in one step, so a power cut never leaves a
+        # truncated config behind.
+        tempPath = str(self.configPath) + '.tmp'
+        try:
+            with open(tempPath, 'w') as configFile:
+                json.dump(self.getConfig(), configFile)
+                configFile.flush()
+                os.fsync(configFile.fileno())
+            os.replace(tempPath, self.configPath)
+        except OSError:
+            traceback.print_exc()
+
+    async def updateConfig(self, config):
+        # Validate everything first so a bad request changes nothing.
+        changes = []
+        for key, types, current, setType in (
+            ('inputs', self.SENSOR_TYPES, self.sensors, self.setSensorType),
+            ('outputs', self.ACTOR_TYPES, self.actors, self.setActorType)
+        ):
+            if key not in config:
+                continue
+            if not isinstance(config[key], list) \
+                    or len(config[key]) != len(current):
+                raise ValueError(
+                    key + ' needs ' + str(len(current)) + ' types'
                 )
-            self.thread = ServerThread(self.server)
+            for index, type in enumerate(config[key]):
+                if type not in types:
+                    raise ValueError(
+                        'unknown type in ' + key + ': ' + str(type)
+                    )
+                if type != current[index]:
+                    changes.append((setType, index, type))
+
+        # One change at a time, a port may not be swapped twice at once.
+        async with self.config_lock:
+            for setType, index, type in changes:
+                await setType(index, type)
+
+    async def setSensorType(self, index, type):
+        # Must be called from the server loop while the server is running.
+        if type not in self.SENSOR_TYPES:
+            raise ValueError('unknown input type: ' + str(type))
+        if type == self.sensors[index]:
+            return
+        if self.server is None:
+            self.sensors[index] = type
+            self.saveConfig()
+            return
+
+        with self.lock:
+            # The old reader can not read the reconfigured input.
+            self.reconfiguring.add(index)
+        try:
+            # Keep the loop serving while the wrapper waits for the TXT.
+            read = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None,
+                self.getSensorReader,
+                index,
+                type
+            )
+            with self.lock:
+                self.removeSensor(index)
+                entry = self.addSensor(index, type, read)
+                self.input_table[index] = entry
+        finally:
+            with self.lock:
+                self.reconfiguring.discard(index)
+        self.thing.property_notify(entry[2])
+        self.thing.add_event(
+            ConfigurationChangedEvent(self.thing, entry[1], type)
+        )
+        self.saveConfig()
+
+    async def setActorType(self, index, type):
+        # Must be called from the server loop while the server is running.
+        if type not in self.ACTOR_TYPES:
+            raise ValueError('unknown output type: ' + str(type))
+        if type == self.actors[index]:
+            return
+        if self.server is None:
+            self.actors[index] = type
+            self.saveConfig()
+            return
 
-            self.timer.start(1000)
-            self.startCams()
+        wrappers = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None,
+            self.getActorWrappers,
+            index,
+            type
+        )
+        with self.lock:
+            self.removeActor(index)
+            props = self.addActor(index, type, wrappers)
+        for prop in props:
+            self.thing.property_notify(prop)
+        self.thing.add_event(
+            ConfigurationChangedEvent(self.thing, 'M' + str(index + 1), type)
+        )
+        self.saveConfig()
 
+    def moveDistance(self, index, distance, speed, action):
+        # Called from the server loop, returns False if the output is no
+        # motor.
+        motor = self.motors[index]
+        if motor is None or self.server is None:
+            return False
+        speedProp = self.actor_props[index][0]
+        with self.lock:
+            previous = self.movements[index]
+            self.outputScheduler.discard(speedProp)
+            self.txt.SyncDataBegin()
             try:
-                self.thread.start()
-                rec.setText('stop')
-                rec.setDisabled(False)
-                self.tabs.setTabEnabled(1, False)
-                self.tabs.setTabEnabled(2, False)
-            except:
-                self.thread.stop()
-                self.server.stop()
-                self.stopCams()
-                self.server = None
-                self.thread = None
-                self.tabs.setTabEnabled(1, True)
-                self.tabs.setTabEnabled(2, True)
-        else:
-            self.thread.stop()
-            self.thread = None
-            self.server = None
-            self.timer.stop()
-            self.stopCams()
-            rec.setText('start')
-            rec.setDisabled(False)
-            self.tabs.setTabEnabled(1, True)
-            self.tabs.setTabEnabled(2, True)
-
-    def update_output(self, index, value, offset=1):
-        if self.outputs[index] == self.txt.C_MOTOR:
-            self.txt.motor(index + offset).setSpeed(value)
-        else:
-            self.txt.output((index * 2) + offset).setLevel(value)
+                # The distance is counted from a reset counter, which the
+                # TXT confirms with a new counter command id.
+                command = self.txt.getCurrentCounterCmdId(index)
+                self.txt.incrCounterCmdId(index)
+                motor.setDistance(distance)
+                motor.setSpeed(speed)
+            finally:
+                self.txt.SyncDataEnd()
+            self.movements[index] = (distance, action, command)
+        if previous is not None:
+            # Replaced by this movement.
+            previous[1].finish()
+        self.set_property(speedProp.name, speed, speedProp)
+        self.set_property(
+            'M' + str(index + 1) + 'remaining',
+            distance,
+            self.actor_props[index][2]
+        )
+        return True
+
+    def stopMovement(self, action):
+        for index, movement in enumerate(self.movements):
+            if movement is not None and movement[1] is action:
+                with self.lock:
+                    self.movements[index] = None
+                    self.motors[index].stop()
+                speedProp = self.actor_props[index][0]
+                self.set_property(speedProp.name, 0, speedProp)
+                self.set_property(
+                    'M' + str(index + 1) + 'remaining',
+                    0,
+                    self.actor_props[index][2]
+                )
 
     def set_property(self, name, value, prop=None):
         if not prop:
@@ -690,33 +4048,79 @@ class wotApplication(TouchApplication):
         if not prop:
             return
 
-        if prop.value.get() != value:
-            prop.value.notify_of_external_update(value)
+        # Value drops updates that do not change anything.
+        self.bridge.put(prop, value)
 
     def update_level(self):
-        # Update inputs
+        with self.lock, self.bridge.tick():
+            self.outputScheduler.flush()
+            self.recorder.sample()
+            self.update_inputs()
+
+    def update_inputs(self):
+        # Update inputs that changed since the last transfer cycle
         new_values = self.txt.getCurrentInput()
-        for index, new_value in enumerate(new_values):
-            name = 'I' + str(index + 1)
-            type = self.sensors[index]
-            prop = self.thing.find_property(name)
-            if type == 'pushbutton' and not prop.value.get() and new_value == 1:
-                self.thing.add_event(PressedEvent(self.thing, name))
-            # TODO filter analog values to avoid flickering
-            self.set_property(
-                name,
-                self.getSensorValue(index, type)
-            )
+        last_values = self.last_inputs
+        self.last_inputs = new_values
+        now = time.time()
+        for index, name, prop, read, button, valueFilter in self.input_table:
+            if index in self.reconfiguring:
+                continue
+            new_value = new_values[index]
+            if last_values is not None and last_values[index] == new_value \
+                    and (valueFilter is None or not valueFilter.pending) \
+                    and (button is None or not button.pending):
+                continue
+            if button is not None:
+                # Buttons follow the debounced level.
+                for kind, at, data in button.update(new_value, now):
+                    self.bridge.call(
+                        self.thing.add_event,
+                        ButtonEvent(self.thing, kind, name, at, data)
+                    )
+                self.set_property(name, button.level, prop)
+                continue
+            value = read()
+            if valueFilter is not None:
+                value = valueFilter.update(value, now)
+            if value is not None:
+                self.set_property(name, value, prop)
+            else:
+                self.metrics.increment('notifications_suppressed_total')
 
-        # Update counters
-        counter_changed = self.txt.getCurrentCounterInput()
-        for index, changed in enumerate(counter_changed):
-            if changed != 0:
-                name = 'C' + str(index + 1)
-                self.set_property(
-                    name,
-                    self.mot(index + 1).getCurrentDistance()
-                )
+        self.update_counters()
+
+    def update_counters(self):
+        # getCurrentCounterInput only flags a change in the last transfer
+        # cycle, which is missed if a tick is skipped and is not set by
+        # resets, so compare the counter values instead.
+        counters = self.txt.getCurrentCounterValue()
+        counter_commands = self.txt.getCurrentCounterCmdId()
+        last_counters = self.last_counters
+        self.last_counters = counters
+        for index, value in enumerate(counters):
+            if last_counters is None or last_counters[index] != value:
+                self.set_property('C' + str(index + 1), value)
+                props = self.actor_props[index]
+                if self.motors[index] is not None and props:
+                    self.set_property(props[1].name, value, props[1])
+                    movement = self.movements[index]
+                    if movement is not None and \
+                            counter_commands[index] != movement[2]:
+                        self.set_property(
+                            props[2].name,
+                            max(movement[0] - value, 0),
+                            props[2]
+                        )
+
+            movement = self.movements[index]
+            if movement is not None and self.motors[index].finished():
+                self.movements[index] = None
+                props = self.actor_props[index]
+                # The TXT stops the motor once it reached the distance.
+                self.set_property(props[0].name, 0, props[0])
+                self.set_property(props[2].name, 0, props[2])
+                self.bridge.call(movement[1].finish)
 
         # Update outputs - shouldn't have to update them.
         # for index, output in enumerate(self.outputs):
@@ -736,22 +4140,159 @@ class wotApplication(TouchApplication):
         #             pwm = self.txt.getPwm(actualIndex)
         #             self.set_property('O' + str(actualIndex + 1), pwm)
 
-        self.capCams()
+    def update_state(self):
+        with self.bridge.tick():
+            self.update_txt_state()
 
+    def update_txt_state(self):
         # Update TXT state propeties
-        self.set_property(
-            'inputVoltage',
-            self.txt.getPower() / 1000
-        )
-        self.set_property(
-            'refVoltage',
-            self.txt.getReferencePower() / 1000
-        )
-        self.set_property(
-            'temperature',
-            self.txt.getTemperature()
-        )
+        now = time.time()
+        for name, prop, read, valueFilter in self.state_table:
+            value = read()
+            if valueFilter is not None:
+                value = valueFilter.update(value, now)
+            if value is not None:
+                self.set_property(name, value, prop)
+            else:
+                self.metrics.increment('notifications_suppressed_total')
+
+
+def connect(simulate=None):
+    if simulate is not None:
+        import simulator
+        txt = simulator.SimulatedTXT()
+        if simulate:
+            with open(simulate) as script:
+                txt.loadScript(json.load(script))
+        return txt
+
+    try:
+        import ftrobopy
+        return ftrobopy.ftrobopy('localhost', 65000)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def parseConfig(argv):
+    parser = argparse.ArgumentParser(description='Web of Things for the TXT')
+    parser.add_argument(
+        '--headless',
+        action='store_true',
+        help='start the server immediately without the touch UI'
+    )
+    parser.add_argument(
+        '--config',
+        default=str(Path(__file__).resolve().parent / 'config.json'),
+        help='JSON file with "inputs" and "outputs" lists of port types, ' +
+        'restored at startup and updated when they change'
+    )
+    parser.add_argument(
+        '--simulate',
+        nargs='?',
+        const='',
+        metavar='SCRIPT',
+        help='use a simulated TXT instead of ftrobopy, optionally with a ' +
+        'JSON file of input signals'
+    )
+    parser.add_argument(
+        '--inputs',
+        help='comma separated types of I1-I8, one of ' +
+        ', '.join(wotServer.SENSOR_TYPES)
+    )
+    parser.add_argument(
+        '--outputs',
+        help='comma separated types of M1-M4, one of ' +
+        ', '.join(wotServer.ACTOR_TYPES)
+    )
+    # The touch UI passes Qt arguments on, ignore them here.
+    args, unknown = parser.parse_known_args(argv[1:])
+
+    defaults = {
+        'inputs': ['pushbutton'] * 8,
+        'outputs': ['motor'] * 4
+    }
+    config = dict(defaults)
+    if os.path.exists(args.config):
+        # Start with the defaults rather than not at all if the file is
+        # broken.
+        try:
+            with open(args.config) as configFile:
+                saved = json.load(configFile)
+            if not isinstance(saved, dict):
+                raise ValueError('not an object')
+            config.update(saved)
+            error = checkConfig(config)
+            if error is not None:
+                raise ValueError(error)
+        except (OSError, ValueError) as e:
+            print(
+                'Ignoring config ' + str(args.config) + ': ' + str(e),
+                file=sys.stderr
+            )
+            config = dict(defaults)
+    if args.inputs:
+        config['inputs'] = args.inputs.split(',')
+    if args.outputs:
+        config['outputs'] = args.outputs.split(',')
+
+    error = checkConfig(config)
+    if error is not None:
+        parser.error(error)
+
+    return args, config
+
+
+def checkConfig(config):
+    # Returns what is wrong with config or None.
+    for key, types, count in (
+        ('inputs', wotServer.SENSOR_TYPES, 8),
+        ('outputs', wotServer.ACTOR_TYPES, 4)
+    ):
+        if not isinstance(config[key], list) or len(config[key]) != count:
+            return key + ' needs ' + str(count) + ' types'
+        for type in config[key]:
+            if type not in types:
+                return 'unknown type in ' + key + ': ' + str(type)
+    return None
+
+
+def runHeadless(txt, args, config):
+    if txt is None:
+        print('Error connecting to IO server', file=sys.stderr)
+        return 1
+
+    core = wotServer(txt, args.config)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    core.start(config['inputs'], config['outputs'])
+    while core.running() and not stopping.wait(1):
+        pass
+    failed = not stopping.is_set()
+    core.stop()
+    return 1 if failed else 0
+
+
+def main(argv):
+    args, config = parseConfig(argv)
+    headless = args.headless
+    if not headless:
+        try:
+            import touchui
+        except ImportError:
+            # Without TouchStyle there is no UI to show.
+            headless = True
+
+    txt = connect(args.simulate)
+    if headless:
+        return runHeadless(txt, args, config)
+
+    core = wotServer(txt, args.config) if txt is not None else None
+    touchui.wotApplication(argv, core, config)
+    return 0
 
 
 if __name__ == '__main__':
-    wotApplication(sys.argv)
+    sys.exit(main(sys.argv))
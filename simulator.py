@@ -0,0 +1,462 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import random
+import struct
+import threading
+import time
+
+
+def constant(value):
+    return lambda t: value
+
+
+def square(period, low=0, high=1, duty=0.5):
+    return lambda t: high if (t % period) < period * duty else low
+
+
+def sine(period, low=0, high=1):
+    middle = (high + low) / 2
+    amplitude = (high - low) / 2
+    return lambda t: middle + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def ramp(period, low=0, high=1):
+    return lambda t: low + (high - low) * (t % period) / period
+
+
+def noise(low=0, high=1):
+    return lambda t: random.uniform(low, high)
+
+
+SIGNALS = {
+    'constant': constant,
+    'square': square,
+    'sine': sine,
+    'ramp': ramp,
+    'noise': noise
+}
+
+
+def signal(spec):
+    # Builds a signal from a script entry like
+    # {"signal": "sine", "period": 2, "low": 0, "high": 5000}.
+    if not isinstance(spec, dict):
+        return constant(spec)
+    args = dict(spec)
+    return SIGNALS[args.pop('signal', 'constant')](**args)
+
+
+# Register blocks of fake I2C devices, each maps a start register to a struct
+# format and a signal per value, with raw register values.
+def lm75(temperature=sine(60, 20, 25)):
+    return {0x00: ('>h', [lambda t: int(temperature(t) / 0.125) << 5])}
+
+
+def mpu6050(period=2):
+    return {0x3B: ('>7h', [
+        sine(period, -4096, 4096),
+        sine(period * 2, -4096, 4096),
+        constant(16384),
+        constant(-3000),
+        sine(period, -1310, 1310),
+        noise(-20, 20),
+        constant(0)
+    ])}
+
+
+def bmx055(period=2):
+    return {0x02: ('<3h', [
+        lambda t: int(sine(period, -128, 128)(t)) << 4,
+        constant(0),
+        constant(128 << 4)
+    ])}
+
+
+class FakeI2CDevice(object):
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.registers = {}
+
+    def read(self, register, length, t):
+        data = bytearray(256)
+        for start, (layout, signals) in self.blocks.items():
+            packed = struct.pack(
+                layout,
+                *[int(round(signal(t))) for signal in signals]
+            )
+            data[start:start + len(packed)] = packed
+        return bytes(data[register:register + length])
+
+    def write(self, register, value):
+        self.registers[register] = value
+
+
+# Answers I2C transactions like ftrobopy, with None for devices that are not
+# attached. latency is the duration of a transaction in seconds.
+class FakeI2CBus(object):
+    def __init__(self, latency=0.001):
+        self.latency = latency
+        self.started = time.time()
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+
+    def attach(self, address, blocks):
+        self.devices[address] = FakeI2CDevice(blocks)
+
+    def i2c_read(self, dev, reg, reg_len=1, data_len=1, debug=False):
+        with self.lock:
+            time.sleep(self.latency)
+            self.reads += 1
+            device = self.devices.get(dev)
+            if device is None:
+                return None
+            return device.read(reg, data_len, time.time() - self.started)
+
+    def i2c_write(self, dev, reg, value, debug=False):
+        with self.lock:
+            time.sleep(self.latency)
+            self.writes += 1
+            device = self.devices.get(dev)
+            if device is None:
+                return None
+            device.write(reg, value)
+            return True
+
+
+# In-process stand-in for ftrobopy.ftrobopy, implementing the parts of its API
+# the Web Thing uses. Inputs follow scriptable signals, motors drive their
+# counters at a rate proportional to their speed.
+class SimulatedTXT(object):
+    C_VOLTAGE = 0
+    C_SWITCH = 1
+    C_RESISTOR = 1
+    C_ULTRASONIC = 3
+    C_ANALOG = 0
+    C_DIGITAL = 1
+    C_OUTPUT = 0
+    C_MOTOR = 1
+
+    # Counter steps per second at full speed, about what an encoder motor
+    # does.
+    COUNTS_PER_SECOND = 150
+    SOUND_DURATION = 1
+
+    def __init__(self, cycle=0.01, name='TXT-sim'):
+        self.cycle = cycle
+        self.name = name
+        self.started = time.time()
+
+        self._exchange_data_lock = threading.RLock()
+        self.updated = threading.Condition()
+        self.cycles = 0
+
+        self.config_outputs = [self.C_OUTPUT] * 4
+        self.config_inputs = [(self.C_SWITCH, self.C_DIGITAL)] * 8
+        self.signals = [constant(0)] * 8
+        self.power = constant(9000)
+        self.reference_power = constant(5000)
+        self.temperature = constant(40)
+
+        self.current_input = [0] * 8
+        self.pwm = [0] * 8
+        self.counter_value = [0] * 4
+        self.counter_position = [0.0] * 4
+        self.counter_input = [0] * 4
+        self.counter_cmd_id = [0] * 4
+        self.current_counter_cmd_id = [0] * 4
+        self.motor_distance = [0] * 4
+        self.motor_cmd_id = [0] * 4
+        self.current_motor_cmd_id = [0] * 4
+        self.sound_until = 0
+
+        self.i2c = FakeI2CBus()
+        self.i2c.attach(0x48, lm75())
+        self.i2c.attach(0x68, mpu6050())
+        self.i2c.attach(0x18, bmx055())
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def setSignal(self, num, signal):
+        self.signals[num - 1] = signal
+
+    def loadScript(self, script):
+        for key, spec in script.items():
+            if key.startswith('I'):
+                self.setSignal(int(key[1:]), signal(spec))
+            elif key in ('power', 'reference_power', 'temperature'):
+                setattr(self, key, signal(spec))
+
+    def run(self):
+        last = time.time()
+        while not self.stopped.wait(self.cycle):
+            now = time.time()
+            self.step(now - self.started, now - last)
+            last = now
+
+    def step(self, t, elapsed):
+        with self._exchange_data_lock:
+            self.current_input = [
+                int(round(signal(t))) for signal in self.signals
+            ]
+            for index in range(4):
+                self.stepCounter(index, elapsed)
+        with self.updated:
+            self.cycles += 1
+            self.updated.notify_all()
+
+    def stepCounter(self, index, elapsed):
+        before = self.counter_value[index]
+        if self.counter_cmd_id[index] != self.current_counter_cmd_id[index]:
+            self.current_counter_cmd_id[index] = self.counter_cmd_id[index]
+            self.counter_position[index] = 0.0
+
+        speed = self.pwm[index * 2] - self.pwm[index * 2 + 1]
+        if self.config_outputs[index] == self.C_MOTOR and speed:
+            self.counter_position[index] += \
+                abs(speed) / 512 * self.COUNTS_PER_SECOND * elapsed
+        distance = self.motor_distance[index]
+        if self.motor_cmd_id[index] != self.current_motor_cmd_id[index]:
+            if distance and self.counter_position[index] >= distance:
+                # Reached the distance, stop like the TXT firmware does.
+                self.counter_position[index] = distance
+                self.pwm[index * 2] = 0
+                self.pwm[index * 2 + 1] = 0
+                self.current_motor_cmd_id[index] = self.motor_cmd_id[index]
+            elif not distance:
+                self.current_motor_cmd_id[index] = self.motor_cmd_id[index]
+
+        self.counter_value[index] = int(self.counter_position[index])
+        self.counter_input[index] = \
+            1 if self.counter_value[index] != before else 0
+
+    def stop(self):
+        self.stopped.set()
+
+    def getDevicename(self):
+        return self.name
+
+    def getVersionNumber(self):
+        return 0x4060600
+
+    def setConfig(self, M, I):
+        self.config_outputs = list(M)
+        self.config_inputs = list(I)
+
+    def getConfig(self):
+        return list(self.config_outputs), list(self.config_inputs)
+
+    def updateConfig(self):
+        pass
+
+    def updateWait(self, minimum_time=0.001):
+        with self.updated:
+            cycles = self.cycles
+            while self.cycles == cycles and not self.stopped.is_set():
+                self.updated.wait(1)
+
+    def SyncDataBegin(self):
+        self._exchange_data_lock.acquire()
+
+    def SyncDataEnd(self):
+        self._exchange_data_lock.release()
+
+    def getCurrentInput(self, idx=None):
+        if idx is None:
+            return list(self.current_input)
+        return self.current_input[idx]
+
+    def getCurrentCounterInput(self, idx=None):
+        if idx is None:
+            return list(self.counter_input)
+        return self.counter_input[idx]
+
+    def getCurrentCounterValue(self, idx=None):
+        if idx is None:
+            return list(self.counter_value)
+        return self.counter_value[idx]
+
+    def incrCounterCmdId(self, idx):
+        self.counter_cmd_id[idx] += 1
+
+    def getCurrentCounterCmdId(self, idx=None):
+        if idx is None:
+            return list(self.current_counter_cmd_id)
+        return self.current_counter_cmd_id[idx]
+
+    def setPwm(self, idx, value):
+        self.pwm[idx] = value
+
+    def getPwm(self, idx=None):
+        if idx is None:
+            return list(self.pwm)
+        return self.pwm[idx]
+
+    def setMotorDistance(self, idx, value):
+        self.motor_distance[idx] = value
+
+    def incrMotorCmdId(self, idx):
+        self.motor_cmd_id[idx] += 1
+
+    def getMotorCmdId(self, idx=None):
+        if idx is None:
+            return list(self.motor_cmd_id)
+        return self.motor_cmd_id[idx]
+
+    def getCurrentMotorCmdId(self, idx=None):
+        if idx is None:
+            return list(self.current_motor_cmd_id)
+        return self.current_motor_cmd_id[idx]
+
+    def getPower(self):
+        return int(self.power(time.time() - self.started))
+
+    def getReferencePower(self):
+        return int(self.reference_power(time.time() - self.started))
+
+    def getTemperature(self):
+        return int(self.temperature(time.time() - self.started))
+
+    def play_sound(self, idx, repeat=1, volume=100):
+        if idx == 0:
+            self.stop_sound()
+        else:
+            self.sound_until = time.time() + self.SOUND_DURATION * repeat
+
+    def stop_sound(self):
+        self.sound_until = 0
+
+    def sound_finished(self):
+        return time.time() >= self.sound_until
+
+    def i2c_read(self, dev, reg, reg_len=1, data_len=1, debug=False):
+        return self.i2c.i2c_read(dev, reg, reg_len, data_len)
+
+    def i2c_write(self, dev, reg, value, debug=False):
+        return self.i2c.i2c_write(dev, reg, value)
+
+    def configureInput(self, num, mode):
+        with self._exchange_data_lock:
+            self.config_inputs[num - 1] = mode
+        self.updateWait()
+
+    def configureOutput(self, num, mode):
+        with self._exchange_data_lock:
+            self.config_outputs[num - 1] = mode
+        self.updateWait()
+
+    def input(self, num):
+        self.configureInput(num, (self.C_SWITCH, self.C_DIGITAL))
+        return SimulatedInput(self, num)
+
+    def resistor(self, num):
+        self.configureInput(num, (self.C_RESISTOR, self.C_ANALOG))
+        return SimulatedInput(self, num)
+
+    def ultrasonic(self, num):
+        self.configureInput(num, (self.C_ULTRASONIC, self.C_ANALOG))
+        return SimulatedInput(self, num)
+
+    def voltage(self, num):
+        self.configureInput(num, (self.C_VOLTAGE, self.C_ANALOG))
+        return SimulatedInput(self, num)
+
+    def trailfollower(self, num):
+        self.configureInput(num, (self.C_VOLTAGE, self.C_DIGITAL))
+        return SimulatedInput(self, num)
+
+    def colorsensor(self, num):
+        self.configureInput(num, (self.C_VOLTAGE, self.C_ANALOG))
+        return SimulatedInput(self, num)
+
+    def motor(self, output):
+        self.configureOutput(output, self.C_MOTOR)
+        return SimulatedMotor(self, output)
+
+    def output(self, num, level=0):
+        self.configureOutput((num + 1) // 2, self.C_OUTPUT)
+        return SimulatedOutput(self, num, level)
+
+
+class SimulatedInput(object):
+    # One class for all input wrappers, they only differ in their method
+    # names on ftrobopy.
+    def __init__(self, txt, num):
+        self.txt = txt
+        self.index = num - 1
+
+    def raw(self):
+        return self.txt.getCurrentInput(self.index)
+
+    def state(self):
+        config = self.txt.config_inputs[self.index]
+        if config == (self.txt.C_VOLTAGE, self.txt.C_DIGITAL):
+            return 1 if self.raw() == 1 or self.raw() > 600 else 0
+        return self.raw()
+
+    def value(self):
+        return self.raw()
+
+    def distance(self):
+        return self.raw()
+
+    def voltage(self):
+        return self.raw()
+
+    def color(self):
+        c = self.raw()
+        if c < 200:
+            return 'weiss'
+        elif c < 1000:
+            return 'rot'
+        return 'blau'
+
+
+class SimulatedMotor(object):
+    def __init__(self, txt, output):
+        self.txt = txt
+        self.index = output - 1
+        self.setSpeed(0)
+        self.setDistance(0)
+
+    def setSpeed(self, speed):
+        with self.txt._exchange_data_lock:
+            self.txt.setPwm(self.index * 2, max(speed, 0))
+            self.txt.setPwm(self.index * 2 + 1, max(-speed, 0))
+
+    def setDistance(self, distance, syncto=None):
+        with self.txt._exchange_data_lock:
+            for motor in (self, syncto):
+                if motor is not None:
+                    # Like ftrobopy, the counter is not reset.
+                    self.txt.setMotorDistance(motor.index, distance)
+                    self.txt.incrMotorCmdId(motor.index)
+
+    def finished(self):
+        return self.txt.getMotorCmdId(self.index) == \
+            self.txt.getCurrentMotorCmdId(self.index)
+
+    def getCurrentDistance(self):
+        return self.txt.getCurrentCounterValue(self.index)
+
+    def stop(self):
+        with self.txt._exchange_data_lock:
+            self.setSpeed(0)
+            self.setDistance(0)
+
+
+class SimulatedOutput(object):
+    def __init__(self, txt, num, level):
+        self.txt = txt
+        self.index = num - 1
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        with self.txt._exchange_data_lock:
+            self.txt.setPwm(self.index, level)
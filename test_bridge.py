@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import contextlib
+import unittest
+from unittest import mock
+from main import UpdateBridge
+
+
+class FakeValue(object):
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def notify_of_external_update(self, value):
+        self.log.append((self.name, value))
+
+
+class FakeProperty(object):
+    def __init__(self, log, name):
+        self.value = FakeValue(log, name)
+
+
+class FakeThing(object):
+    def __init__(self):
+        self.batches = 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        self.batches += 1
+        yield
+
+
+class FakeLoop(object):
+    def __init__(self):
+        self.callbacks = []
+
+    def call_soon_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+
+class UpdateBridgeTest(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.thing = FakeThing()
+        self.loop = FakeLoop()
+        self.bridge = UpdateBridge(self.thing)
+        self.bridge.attach(self.loop)
+        self.a = FakeProperty(self.log, 'a')
+        self.b = FakeProperty(self.log, 'b')
+
+    def test_latest_value_of_every_property(self):
+        # The loop is stalled for many ticks, b only changed in the first.
+        for value in range(100):
+            with self.bridge.tick():
+                self.bridge.put(self.a, value)
+                if value == 0:
+                    self.bridge.put(self.b, 1)
+        self.bridge.drain()
+        self.assertEqual(self.log, [('a', 99), ('b', 1)])
+        self.assertEqual(self.thing.batches, 1)
+
+    def test_calls_run_after_values(self):
+        with self.bridge.tick():
+            self.bridge.call(self.log.append, 'call')
+            self.bridge.put(self.a, 1)
+        self.bridge.drain()
+        self.assertEqual(self.log, [('a', 1), 'call'])
+
+    def test_no_call_is_lost(self):
+        for value in range(2000):
+            with self.bridge.tick():
+                self.bridge.call(self.log.append, value)
+        self.bridge.call(self.log.append, 'outside')
+        self.bridge.drain()
+        self.assertEqual(self.log, list(range(2000)) + ['outside'])
+
+    def test_failing_call(self):
+        def fail():
+            raise RuntimeError('failed')
+        self.bridge.call(fail)
+        self.bridge.call(self.log.append, 'call')
+        with mock.patch('traceback.print_exc') as print_exc:
+            self.bridge.drain()
+        self.assertEqual(self.log, ['call'])
+        self.assertEqual(print_exc.call_count, 1)
+
+    def test_discard(self):
+        self.bridge.put(self.a, 1)
+        self.bridge.put(self.b, 2)
+        self.bridge.discard(self.a)
+        self.bridge.drain()
+        self.assertEqual(self.log, [('b', 2)])
+
+    def test_drain_is_scheduled_once(self):
+        # Attaching scheduled one already.
+        self.bridge.drain()
+        self.loop.callbacks = []
+        self.bridge.put(self.a, 1)
+        self.bridge.put(self.a, 2)
+        self.assertEqual(len(self.loop.callbacks), 1)
+        self.bridge.drain()
+        self.bridge.put(self.a, 3)
+        self.assertEqual(len(self.loop.callbacks), 2)
+
+    def test_detach(self):
+        self.bridge.put(self.a, 1)
+        self.bridge.call(self.log.append, 'call')
+        self.bridge.detach()
+        self.bridge.drain()
+        self.bridge.attach(self.loop)
+        self.bridge.drain()
+        self.assertEqual(self.log, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
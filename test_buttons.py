@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+from main import ButtonState
+
+
+def run(button, samples, cycle=0.01, until=None):
+    # Feeds the button every transfer cycle, samples is a list of
+    # (start, end) times the button is down. Returns the events.
+    events = []
+    until = until or max(end for start, end in samples) + 1
+    for step in range(int(round(until / cycle)) + 1):
+        now = step * cycle
+        level = any(start <= now < end for start, end in samples)
+        events.extend(button.update(level, now))
+    return events
+
+
+def kinds(events):
+    return [kind for kind, at, data in events]
+
+
+class ButtonStateTest(unittest.TestCase):
+    def test_press_and_release(self):
+        events = run(ButtonState(False), [(0.1, 0.3)])
+        self.assertEqual(kinds(events), ['pressed', 'released'])
+        self.assertAlmostEqual(events[0][1], 0.1)
+        self.assertEqual(events[0][2], {'count': 1})
+        self.assertAlmostEqual(events[1][2]['duration'], 0.2)
+
+    def test_bounce_and_glitch(self):
+        # Contact bounce right after the press and a spike shorter than
+        # the debounce time.
+        events = run(
+            ButtonState(False),
+            [(0.1, 0.11), (0.12, 0.4), (0.8, 0.805)]
+        )
+        self.assertEqual(kinds(events), ['pressed', 'released'])
+
+    def test_long_press(self):
+        events = run(ButtonState(False), [(0.1, 1.5)])
+        self.assertEqual(kinds(events), ['pressed', 'longPress', 'released'])
+        self.assertAlmostEqual(events[1][1], 1.1)
+
+    def test_release_just_before_long_press(self):
+        # The release is still being debounced when the long press time
+        # is reached.
+        events = run(ButtonState(False), [(0.1, 1.095)])
+        self.assertEqual(kinds(events), ['pressed', 'released'])
+
+    def test_double_click(self):
+        events = run(ButtonState(False), [(0.1, 0.2), (0.4, 0.5)])
+        self.assertEqual(
+            kinds(events),
+            ['pressed', 'released', 'pressed', 'doubleClick', 'released']
+        )
+
+    def test_slow_clicks(self):
+        events = run(ButtonState(False), [(0.1, 0.2), (0.8, 0.9)])
+        self.assertNotIn('doubleClick', kinds(events))
+
+    def test_long_press_is_no_click(self):
+        events = run(ButtonState(False), [(0.1, 1.3), (1.5, 1.6)])
+        self.assertNotIn('doubleClick', kinds(events))
+
+    def test_held_at_start(self):
+        events = run(ButtonState(True), [(0, 2)])
+        self.assertEqual(kinds(events), ['released'])
+        self.assertIsNone(events[0][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+from main import AnalogFilter
+
+
+class AnalogFilterTest(unittest.TestCase):
+    def test_first_value_is_published(self):
+        self.assertEqual(AnalogFilter().update(3, 0), 3)
+
+    def test_unchanged_value_is_suppressed(self):
+        valueFilter = AnalogFilter()
+        valueFilter.update(3, 0)
+        self.assertIsNone(valueFilter.update(3, 1))
+        self.assertEqual(valueFilter.update(4, 2), 4)
+
+    def test_deadband(self):
+        valueFilter = AnalogFilter(deadband=0.5)
+        valueFilter.update(1, 0)
+        self.assertIsNone(valueFilter.update(1.4, 1))
+        self.assertEqual(valueFilter.update(1.6, 2), 1.6)
+
+    def test_relative_deadband(self):
+        valueFilter = AnalogFilter(deadband=0.1, relative=True)
+        valueFilter.update(100, 0)
+        self.assertIsNone(valueFilter.update(105, 1))
+        self.assertEqual(valueFilter.update(111, 2), 111)
+
+    def test_interval(self):
+        valueFilter = AnalogFilter(interval=1)
+        valueFilter.update(1, 0)
+        self.assertIsNone(valueFilter.update(5, 0.5))
+        # Keeps being fed until the change could be published.
+        self.assertTrue(valueFilter.pending)
+        self.assertEqual(valueFilter.update(5, 1), 5)
+        self.assertFalse(valueFilter.pending)
+
+    def test_ema(self):
+        valueFilter = AnalogFilter(smoothing='ema', alpha=0.5)
+        self.assertEqual(valueFilter.update(0, 0), 0)
+        self.assertEqual(valueFilter.update(10, 1), 5)
+        self.assertTrue(valueFilter.pending)
+        self.assertEqual(valueFilter.update(10, 2), 7.5)
+
+    def test_ema_settles_on_raw_value(self):
+        # Within half the deadband of the raw value the output jumps to it
+        # instead of approaching it forever.
+        valueFilter = AnalogFilter(smoothing='ema', alpha=0.5, deadband=4)
+        valueFilter.update(0, 0)
+        self.assertEqual(valueFilter.update(10, 1), 5)
+        self.assertIsNone(valueFilter.update(10, 2))
+        self.assertEqual(valueFilter.update(10, 3), 10)
+        self.assertFalse(valueFilter.pending)
+
+    def test_median(self):
+        valueFilter = AnalogFilter(smoothing='median', window=3)
+        self.assertEqual(valueFilter.update(1, 0), 1)
+        # A single spike does not get through.
+        self.assertIsNone(valueFilter.update(100, 1))
+        self.assertEqual(valueFilter.update(2, 2), 2)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            AnalogFilter(smoothing='mean')
+        with self.assertRaises(TypeError):
+            AnalogFilter(alpha='0.5')
+        with self.assertRaises(ValueError):
+            AnalogFilter(window=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
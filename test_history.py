@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+from main import PropertyHistory, aggregate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def fill(history, samples):
+    for timestamp, value in samples:
+        history.append(timestamp, value)
+    return history
+
+
+class PropertyHistoryTest(unittest.TestCase):
+    def samples(self, history, start=None, end=None):
+        timestamps, values = history.samples(start, end)
+        return list(timestamps), list(values)
+
+    def test_samples(self):
+        history = fill(PropertyHistory(3), [(1, 10), (2, 20)])
+        self.assertEqual(self.samples(history), ([1, 2], [10, 20]))
+
+    def test_oldest_samples_are_overwritten(self):
+        history = fill(
+            PropertyHistory(3),
+            [(1, 10), (2, 20), (3, 30), (4, 40)]
+        )
+        self.assertEqual(self.samples(history), ([2, 3, 4], [20, 30, 40]))
+
+    def test_range(self):
+        history = fill(
+            PropertyHistory(3),
+            [(1, 10), (2, 20), (3, 30), (4, 40)]
+        )
+        self.assertEqual(self.samples(history, 3), ([3, 4], [30, 40]))
+        self.assertEqual(self.samples(history, None, 2.5), ([2], [20]))
+        self.assertEqual(self.samples(history, 3, 3), ([3], [30]))
+        self.assertEqual(self.samples(history, 5), ([], []))
+
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class AggregateTest(unittest.TestCase):
+    def test_buckets(self):
+        result = aggregate([0, 1, 2, 5], [1, 3, 2, 10], 0, 6, 3)
+        self.assertEqual(result['timestamps'], [0, 2, 4])
+        self.assertEqual(result['min'], [1, 2, 10])
+        self.assertEqual(result['max'], [3, 2, 10])
+        self.assertEqual(result['mean'], [2, 2, 10])
+        self.assertEqual(result['count'], [2, 1, 1])
+
+    def test_empty_bucket(self):
+        result = aggregate([0], [1], 0, 4, 2)
+        self.assertEqual(result['mean'], [1, None])
+        self.assertEqual(result['min'], [1, None])
+        self.assertEqual(result['count'], [1, 0])
+
+    def test_end_belongs_to_last_bucket(self):
+        self.assertEqual(aggregate([4], [1], 0, 4, 2)['count'], [0, 1])
+
+    def test_no_samples(self):
+        result = aggregate([], [], 0, 1, 2)
+        self.assertEqual(result['max'], [None, None])
+        self.assertEqual(result['count'], [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+import simulator
+from main import BMX055, I2CDevice, LM75, MPU6050
+
+
+def block(register, layout, *values):
+    # Register block of constant raw values for FakeI2CBus.
+    return {register: (layout, [simulator.constant(v) for v in values])}
+
+
+class I2CDeviceTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = simulator.FakeI2CBus(latency=0)
+
+    def test_lm75(self):
+        self.bus.attach(0x48, simulator.lm75(simulator.constant(25.5)))
+        self.assertEqual(LM75('room').read(self.bus), [25.5])
+
+    def test_lm75_below_zero(self):
+        self.bus.attach(0x49, simulator.lm75(simulator.constant(-0.5)))
+        self.assertEqual(LM75('outside', 0x49).read(self.bus), [-0.5])
+
+    def test_mpu6050(self):
+        self.bus.attach(0x68, block(
+            0x3B,
+            '>7h',
+            16384, -8192, 0, -3000, 131, -262, 0
+        ))
+        device = MPU6050('imu')
+        device.setup(self.bus)
+        self.assertEqual(self.bus.devices[0x68].registers, {0x6B: 0})
+        self.assertEqual(
+            device.read(self.bus),
+            [1.0, -0.5, 0.0, 27.7, 1.0, -2.0, 0.0]
+        )
+
+    def test_bmx055(self):
+        self.bus.attach(0x18, block(0x02, '<3h', 128 << 4, -128 << 4, 0))
+        device = BMX055('acc')
+        device.setup(self.bus)
+        self.assertEqual(
+            self.bus.devices[0x18].registers,
+            {0x0F: 0x0C, 0x10: 0x0F}
+        )
+        self.assertEqual(device.read(self.bus), [1.0, -1.0, 0.0])
+
+    def test_one_value_per_property(self):
+        for device, blocks in (
+            (LM75('room'), simulator.lm75()),
+            (MPU6050('imu'), simulator.mpu6050()),
+            (BMX055('acc'), simulator.bmx055())
+        ):
+            self.bus.attach(device.address, blocks)
+            self.assertEqual(
+                len(device.read(self.bus)),
+                len(device.VALUES)
+            )
+
+    def test_missing_device(self):
+        with self.assertRaises(IOError):
+            LM75('room').read(self.bus)
+        with self.assertRaises(IOError):
+            MPU6050('imu').setup(self.bus)
+
+    def test_rate(self):
+        self.assertEqual(LM75('room', rate=4).interval, 0.25)
+
+    def test_decode_is_abstract(self):
+        with self.assertRaises(TypeError):
+            I2CDevice('device')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+from unittest import mock
+from main import OutputScheduler, ScheduledValue
+
+
+class FakeTXT(object):
+    def SyncDataBegin(self):
+        pass
+
+    def SyncDataEnd(self):
+        pass
+
+
+class FakeBridge(object):
+    def __init__(self):
+        self.values = []
+        self.resolved = []
+
+    def put(self, prop, value):
+        self.values.append(value)
+
+    def call(self, callback, *args):
+        self.resolved.extend(args)
+
+
+class FakeProperty(object):
+    def __init__(self, value=0):
+        self.value = ScheduledValue(value)
+
+
+class OutputSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.bridge = FakeBridge()
+        self.prop = FakeProperty()
+        self.writes = []
+
+    def scheduler(self, slew=None):
+        return OutputScheduler(FakeTXT(), self.bridge, slew)
+
+    def flush(self, scheduler, cycle):
+        # Transfer cycles are an eighth of a second apart.
+        with mock.patch('time.time', return_value=1000 + cycle / 8):
+            scheduler.flush()
+
+    def test_last_write_wins(self):
+        scheduler = self.scheduler()
+        scheduler.set(self.prop, self.writes.append, 100)
+        scheduler.set(self.prop, self.writes.append, 200)
+        self.flush(scheduler, 0)
+        self.assertEqual(self.writes, [200])
+        self.assertEqual(self.bridge.values, [200])
+        self.assertEqual(self.bridge.resolved, [200])
+        self.flush(scheduler, 1)
+        self.assertEqual(self.writes, [200])
+
+    def test_slew(self):
+        scheduler = self.scheduler(slew=80)
+        self.flush(scheduler, 0)
+        scheduler.set(self.prop, self.writes.append, 50)
+        for step in range(1, 7):
+            self.flush(scheduler, step)
+        self.assertEqual(self.writes, [10, 20, 30, 40, 50])
+        # Only answered once the target is reached.
+        self.assertEqual(self.bridge.resolved, [50])
+
+    def test_slew_to_new_target(self):
+        scheduler = self.scheduler(slew=80)
+        self.flush(scheduler, 0)
+        scheduler.set(self.prop, self.writes.append, 50)
+        self.flush(scheduler, 1)
+        self.flush(scheduler, 2)
+        scheduler.set(self.prop, self.writes.append, -10)
+        for step in range(3, 7):
+            self.flush(scheduler, step)
+        self.assertEqual(self.writes, [10, 20, 10, 0, -10])
+
+    def test_minimum_step(self):
+        scheduler = self.scheduler(slew=1)
+        self.flush(scheduler, 0)
+        scheduler.set(self.prop, self.writes.append, 5)
+        self.flush(scheduler, 1)
+        self.flush(scheduler, 2)
+        self.assertEqual(self.writes, [1, 2])
+
+    def test_first_flush_is_not_ramped(self):
+        scheduler = self.scheduler(slew=80)
+        scheduler.set(self.prop, self.writes.append, 500)
+        self.flush(scheduler, 0)
+        self.assertEqual(self.writes, [500])
+
+    def test_discard(self):
+        scheduler = self.scheduler()
+        scheduler.set(self.prop, self.writes.append, 100)
+        scheduler.discard(self.prop)
+        self.flush(scheduler, 0)
+        self.assertEqual(self.writes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run with python3 -m unittest
+
+import unittest
+import tornado.httputil
+from main import CachedResponse, ProxyCache
+
+DATE = 'Mon, 01 Jan 2018 00:00:00 GMT'
+
+
+def lifetime(**headers):
+    # Keyword arguments use _ for -.
+    return ProxyCache().lifetime(tornado.httputil.HTTPHeaders({
+        name.replace('_', '-'): value for name, value in headers.items()
+    }))
+
+
+def entry(body):
+    return CachedResponse([], body, '"etag"', None, None)
+
+
+class LifetimeTest(unittest.TestCase):
+    def test_max_age(self):
+        self.assertEqual(lifetime(Cache_Control='public, max-age=60'), 60)
+        self.assertEqual(
+            lifetime(Cache_Control='max-age=60, s-maxage=120'),
+            120
+        )
+        self.assertEqual(lifetime(Cache_Control='max-age=soon'), 0)
+
+    def test_not_stored(self):
+        self.assertIsNone(lifetime(Cache_Control='no-store'))
+        self.assertIsNone(lifetime(Cache_Control='private, max-age=60'))
+        self.assertIsNone(
+            lifetime(Cache_Control='max-age=60', Set_Cookie='a')
+        )
+
+    def test_no_cache(self):
+        self.assertEqual(lifetime(Cache_Control='no-cache, max-age=60'), 0)
+
+    def test_vary(self):
+        # Cached responses are fetched without Accept-Encoding.
+        self.assertEqual(
+            lifetime(Cache_Control='max-age=60', Vary='Accept-Encoding'),
+            60
+        )
+        self.assertIsNone(lifetime(
+            Cache_Control='max-age=60',
+            Vary='Accept-Encoding, Cookie'
+        ))
+        self.assertIsNone(lifetime(Cache_Control='max-age=60', Vary='*'))
+
+    def test_expires(self):
+        self.assertEqual(
+            lifetime(Date=DATE, Expires='Mon, 01 Jan 2018 01:00:00 GMT'),
+            3600
+        )
+        self.assertEqual(lifetime(Date=DATE, Expires='0'), 0)
+        self.assertEqual(
+            lifetime(Date=DATE, Expires='Sun, 31 Dec 2017 00:00:00 GMT'),
+            0
+        )
+
+    def test_last_modified(self):
+        # A tenth of the age, at most a day.
+        self.assertEqual(
+            lifetime(Date=DATE, Last_Modified='Fri, 22 Dec 2017 00:00:00 GMT'),
+            86400
+        )
+        self.assertEqual(
+            lifetime(Date=DATE, Last_Modified='Mon, 01 Jan 2001 00:00:00 GMT'),
+            86400
+        )
+        self.assertEqual(
+            lifetime(Date=DATE, Last_Modified='Sun, 31 Dec 2017 00:00:00 GMT'),
+            8640
+        )
+
+    def test_no_validators(self):
+        self.assertEqual(lifetime(), 0)
+
+
+class ProxyCacheTest(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = ProxyCache(max_size=10, max_entry_size=6)
+        cache.put('a', entry(b'aaaaa'))
+        cache.put('b', entry(b'bbbbb'))
+        cache.get('a')
+        cache.put('c', entry(b'ccccc'))
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.size, 10)
+
+    def test_too_big(self):
+        cache = ProxyCache(max_size=10, max_entry_size=6)
+        cache.put('a', entry(b'aaaaa'))
+        cache.put('a', entry(b'aaaaaaa'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+
+    def test_discard(self):
+        cache = ProxyCache()
+        cache.put('a', entry(b'aaaaa'))
+        cache.discard('a')
+        cache.discard('b')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
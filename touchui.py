@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import traceback
+from TouchStyle import *
+
+
+class wotApplication(TouchApplication):
+    def __init__(self, args, core, config):
+        TouchApplication.__init__(self, args)
+
+        self.w = TouchWindow('WebOfTXT')
+
+        self.core = core
+        self.config = config
+        self.inputButtons = []
+        self.outputButtons = []
+
+        if not self.core:
+            err_msg = QLabel('Error connectiong to IO server')
+            err_msg.setWordWrap(True)
+            err_msg.setAlignment(Qt.AlignCenter)
+            self.w.setCentralWidget(err_msg)
+        else:
+            main_page = self.buildMainPage()
+            input_page = self.buildInputPage()
+            output_page = self.buildOutputPage()
+
+            tabBar = QTabWidget()
+            tabBar.addTab(main_page, 'Start')
+            tabBar.addTab(input_page, 'Inputs')
+            tabBar.addTab(output_page, 'Outputs')
+            self.w.setCentralWidget(tabBar)
+            self.tabs = tabBar
+
+        self.w.show()
+        self.exec_()
+
+    def buildMainPage(self):
+        page = QWidget()
+        vbox = QVBoxLayout()
+        button = QPushButton('start')
+        button.clicked.connect(self.start)
+        vbox.addWidget(button)
+        page.setLayout(vbox)
+        return page
+
+    def buildInputPage(self):
+        page = QWidget()
+        vbox = QVBoxLayout()
+        for input in range(1, 9):
+            hbox = QHBoxLayout()
+            title = QLabel('I' + str(input))
+            hbox.addWidget(title)
+            type = QPushButton(self.config['inputs'][input - 1])
+            type.clicked.connect(self.toggleInputType)
+            hbox.addWidget(type)
+            vbox.addLayout(hbox)
+            self.inputButtons.append(type)
+        page.setLayout(vbox)
+        return page
+
+    def buildOutputPage(self):
+        page = QWidget()
+        vbox = QVBoxLayout()
+        for output in range(1, 5):
+            hbox = QHBoxLayout()
+            title = QLabel('M' + str(output))
+            hbox.addWidget(title)
+            type = QPushButton(self.config['outputs'][output - 1])
+            type.clicked.connect(self.toggleOutputType)
+            hbox.addWidget(type)
+            vbox.addLayout(hbox)
+            self.outputButtons.append(type)
+        page.setLayout(vbox)
+        return page
+
+    def refreshTypes(self):
+        # The types may have been changed through /config while running.
+        config = self.core.getConfig()
+        for button, type in zip(self.inputButtons, config['inputs']):
+            button.setText(type)
+        for button, type in zip(self.outputButtons, config['outputs']):
+            button.setText(type)
+
+    def toggleType(self, types):
+        rec = self.sender()
+        index = types.index(rec.text())
+        rec.setText(types[(index + 1) % len(types)])
+
+    def toggleInputType(self):
+        self.toggleType(self.core.SENSOR_TYPES)
+
+    def toggleOutputType(self):
+        self.toggleType(self.core.ACTOR_TYPES)
+
+    def start(self):
+        rec = self.sender()
+        rec.setDisabled(True)
+        if self.core.server is None:
+            try:
+                self.core.start(
+                    [button.text() for button in self.inputButtons],
+                    [button.text() for button in self.outputButtons]
+                )
+                rec.setText('stop')
+                self.tabs.setTabEnabled(1, False)
+                self.tabs.setTabEnabled(2, False)
+            except Exception:
+                traceback.print_exc()
+                self.tabs.setTabEnabled(1, True)
+                self.tabs.setTabEnabled(2, True)
+        else:
+            self.core.stop()
+            self.refreshTypes()
+            rec.setText('start')
+            self.tabs.setTabEnabled(1, True)
+            self.tabs.setTabEnabled(2, True)
+        rec.setDisabled(False)